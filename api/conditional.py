@@ -0,0 +1,29 @@
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """A strong ETag from the values a representation depends on."""
+    return '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Return a 304 response when the request's If-None-Match / If-Modified-Since
+    validators still match, otherwise None. `last_modified` is a datetime.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        add_validators(response, etag, last_modified)
+    return response
+
+
+def add_validators(response, etag, last_modified=None):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    # Clients may keep the response but must revalidate before reusing it.
+    response["Cache-Control"] = "no-cache"
+    return response
@@ -0,0 +1,23 @@
+from django.db.backends.signals import connection_created
+
+# Applied to every new SQLite connection. WAL lets readers carry on while a
+# writer commits, and synchronous=NORMAL is safe under WAL while saving an
+# fsync per commit. In-memory databases (the test suite) ignore journal_mode.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",  # 20 MB page cache per connection
+)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+
+
+def connect_signals():
+    connection_created.connect(configure_sqlite, dispatch_uid="api.db.configure_sqlite")
@@ -0,0 +1,82 @@
+import random
+import string
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from api.models import Room
+
+HOST_PREFIX = "bench-room-"
+
+
+def checked_code():
+    """The previous generator: look every candidate up before using it."""
+    while True:
+        code = ''.join(random.choices(string.ascii_uppercase, k=8))
+        if Room.objects.filter(code=code).count() == 0:
+            return code
+
+
+def create_rooms(start, stop, legacy):
+    try:
+        for index in range(start, stop):
+            room = Room(host=f"{HOST_PREFIX}{index}")
+            if legacy:
+                room.code = checked_code()
+            room.save()
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Create rooms from concurrent threads and report throughput and queries per room. "
+        "Runs against a throwaway test database, never the configured one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=100_000, help="Rooms to create (default 100000)")
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent creators (default 8)")
+        parser.add_argument("--legacy", action="store_true", help="Check each code with count() first, as before")
+
+    def handle(self, *args, **options):
+        # A separate database keeps 100k rows out of real data; SQLite gets a
+        # file so creator threads can share it.
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == "sqlite":
+                connection.settings_dict.setdefault("TEST", {})["NAME"] = str(Path(directory) / "bench.sqlite3")
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.run(options)
+            finally:
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        rooms, threads, legacy = options["rooms"], options["threads"], options["legacy"]
+
+        with CaptureQueriesContext(connection) as context:
+            create_rooms(0, 100, legacy)
+        sample = len(context.captured_queries) / 100
+
+        batch = -(-rooms // threads)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            futures = [
+                pool.submit(create_rooms, start, min(start + batch, rooms + 100), legacy)
+                for start in range(100, rooms + 100, batch)
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        created = Room.objects.count()
+        codes = Room.objects.values("code").distinct().count()
+        self.stdout.write(
+            f"{'count() check' if legacy else 'insert and retry'}: {rooms} rooms from {threads} threads "
+            f"in {elapsed:.1f} s ({rooms / elapsed:,.0f} rooms/s), {sample:.1f} queries per room, "
+            f"{created - 100} created, {codes} distinct codes"
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_room_current_song'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='skip_votes',
+            field=models.IntegerField(default=0),
+        ),
+    ]
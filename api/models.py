@@ -1,16 +1,19 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 import string
 import random
 
-def generate_unique_code():
-    length = 8  # Match max_length of 'code' field
+CODE_ATTEMPTS = 5  # Inserts tried with fresh codes before a collision is reported
 
-    while True:
-        code = ''.join(random.choices(string.ascii_uppercase, k=length))
-        if Room.objects.filter(code=code).count() == 0:
-            break
+def generate_unique_code():
+    """
+    Return a random room code without querying the database.
 
-    return code
+    With 26^8 (about 2 * 10^11) codes a clash is rare even with millions of
+    rooms; Room.save() relies on the unique constraint and retries with a new
+    code when one happens.
+    """
+    length = 8  # Match max_length of 'code' field
+    return ''.join(random.choices(string.ascii_uppercase, k=length))
 
 class Room(models.Model):
     code = models.CharField(max_length=8, default=generate_unique_code, unique=True)
@@ -18,4 +21,41 @@ class Room(models.Model):
     guest_can_pause = models.BooleanField(null=False, default=False)
     votes_to_skip = models.IntegerField(null=False, default=1)
     created_at = models.DateTimeField(auto_now_add=True)
-    current_song=models.CharField(max_length=50,null=True)
\ No newline at end of file
+    updated_at = models.DateTimeField(auto_now=True)  # Must be listed whenever update_fields is passed
+    current_song=models.CharField(max_length=50,null=True)
+    skip_votes = models.IntegerField(null=False, default=0)  # Votes to skip current_song
+    skipped_song = models.CharField(max_length=50, null=True)  # Song a vote skipped, until Spotify moves on
+
+    class Meta:
+        indexes = [
+            # Cursor pagination of the room list, newest first.
+            models.Index(fields=["-created_at", "-id"], name="room_created_idx"),
+            # The room list's "active" filter.
+            models.Index(fields=["updated_at"], name="room_updated_idx"),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The code drawn by generate_unique_code, if any. Only that code is
+        # replaced on a clash; a code the caller chose is theirs to handle.
+        self._generated_code = self.code if not args and "code" not in kwargs else None
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        for attempt in range(CODE_ATTEMPTS):
+            try:
+                # The savepoint keeps an enclosing transaction usable after a clash.
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # Only a generated code that is taken is retried; a duplicate
+                # host or a chosen code is the caller's error.
+                if (
+                    attempt == CODE_ATTEMPTS - 1
+                    or self.code != self._generated_code
+                    or not Room.objects.filter(code=self.code).exists()
+                ):
+                    raise
+                self.code = self._generated_code = generate_unique_code()
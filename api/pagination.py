@@ -0,0 +1,13 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class RoomCursorPagination(CursorPagination):
+    """Newest rooms first; each page is an index range scan rather than an OFFSET."""
+    ordering = ("-created_at", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def get_page_size(self, request):
+        self.page_size = settings.ROOM_LIST_PAGE_SIZE
+        return super().get_page_size(request)
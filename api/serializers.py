@@ -6,6 +6,12 @@ class RoomSerializer(serializers.ModelSerializer):
         model = Room
         fields = ('id', 'code', 'host', 'guest_can_pause', 'votes_to_skip', 'created_at')
 
+class RoomListSerializer(serializers.ModelSerializer):
+    # Public listing: leaves out the host's session key.
+    class Meta:
+        model = Room
+        fields = ('id', 'code', 'guest_can_pause', 'votes_to_skip', 'created_at', 'current_song')
+
 class CreateRoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = Room
@@ -1,3 +1,82 @@
+from unittest import skipUnless
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from .models import Room
 
-# Create your tests here.
+
+@skipUnless(connection.vendor == "sqlite", "SQLite pragmas")
+class SQLitePragmaTests(TestCase):
+    def test_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA temp_store")
+            self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+
+
+class RoomCodeTests(TestCase):
+    def test_taken_generated_code_is_replaced_on_insert(self):
+        room = Room(host="second")
+        taken = room.code
+        Room.objects.create(code=taken, host="first")
+        room.save()
+
+        self.assertNotEqual(room.code, taken)
+        self.assertEqual(Room.objects.count(), 2)
+
+    def test_taken_chosen_code_is_not_replaced(self):
+        Room.objects.create(code="TAKENNNN", host="first")
+        with self.assertRaises(IntegrityError):
+            Room.objects.create(code="TAKENNNN", host="second")
+
+    def test_duplicate_host_is_not_retried(self):
+        Room.objects.create(host="host")
+        with self.assertRaises(IntegrityError):
+            Room.objects.create(host="host")
+
+    def test_create_checks_no_codes_up_front(self):
+        # Savepoint, insert, release.
+        with self.assertNumQueries(3):
+            Room.objects.create(host="host")
+
+
+class RoomListTests(TestCase):
+    def setUp(self):
+        for index in range(3):
+            Room.objects.create(host=f"host-{index}", current_song="song" if index == 0 else None)
+
+    def test_pages_by_cursor_without_host_keys(self):
+        first = self.client.get("/api/room", {"page_size": 2}).json()
+        second = self.client.get(first["next"]).json()
+
+        self.assertEqual(len(first["results"]), 2)
+        self.assertEqual(len(second["results"]), 1)
+        self.assertNotIn("host", first["results"][0])
+
+    def test_playing_filter(self):
+        results = self.client.get("/api/room", {"playing": "1"}).json()["results"]
+        self.assertEqual([room["current_song"] for room in results], ["song"])
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.client.get("/api/room")["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/room", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Room.objects.create(host="host-new")
+        self.assertEqual(self.client.get("/api/room", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_follows_the_rows_on_the_page(self):
+        etag = self.client.get("/api/room", {"page_size": 1})["ETag"]
+        oldest = Room.objects.get(host="host-0")
+        oldest.votes_to_skip = 5
+        oldest.save()
+        response = self.client.get("/api/room", {"page_size": 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)  # Not on the first page
+
+        newest = Room.objects.get(host="host-2")
+        newest.votes_to_skip = 5
+        newest.save()
+        response = self.client.get("/api/room", {"page_size": 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
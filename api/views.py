@@ -1,15 +1,59 @@
+from datetime import timedelta
+from django.conf import settings
 from django.shortcuts import render
+from django.utils import timezone
 from rest_framework import generics, status
-from .serializers import RoomSerializer, CreateRoomSerializer,UpdateRoomSerializer
+from .conditional import add_validators, make_etag, not_modified
+from .pagination import RoomCursorPagination
+from .serializers import RoomSerializer, RoomListSerializer, CreateRoomSerializer,UpdateRoomSerializer
 from .models import Room
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.http import JsonResponse
 
+
+def query_flag(request, name):
+    return request.query_params.get(name, "").lower() in ("1", "true", "yes")
+
+
 class RoomView(generics.ListAPIView):
-    queryset = Room.objects.all()
-    serializer_class = RoomSerializer
-    
+    """
+    Public room list, newest first, paginated by cursor.
+
+    ?active=1 keeps rooms changed within ROOM_ACTIVE_WINDOW seconds and
+    ?playing=1 rooms with a current song. Responses carry an ETag derived
+    from the page's own rows and links, so an unchanged page is answered with
+    a 304 after the one index-range query that fetches it, and nothing scans
+    the rest of the table. There is no Last-Modified: a room deleted from the
+    page needn't move its newest updated_at.
+    """
+    serializer_class = RoomListSerializer
+    pagination_class = RoomCursorPagination
+
+    def get_queryset(self):
+        queryset = Room.objects.only(*RoomListSerializer.Meta.fields, "updated_at")
+        if query_flag(self.request, "active"):
+            since = timezone.now() - timedelta(seconds=settings.ROOM_ACTIVE_WINDOW)
+            queryset = queryset.filter(updated_at__gte=since)
+        if query_flag(self.request, "playing"):
+            queryset = queryset.exclude(current_song=None)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        etag = make_etag(
+            request.get_full_path(),
+            [(room.pk, room.updated_at) for room in page],
+            self.paginator.get_next_link(),
+            self.paginator.get_previous_link(),
+        )
+
+        response = not_modified(request, etag)
+        if response is None:
+            serializer = self.get_serializer(page, many=True)
+            response = add_validators(self.get_paginated_response(serializer.data), etag)
+        return response
+
 class GetRoom(APIView):
     serializer_class = RoomSerializer
     lookup_url_kwarg = 'code'
@@ -17,12 +61,18 @@ class GetRoom(APIView):
     def get(self, request, format=None):
         code = request.GET.get(self.lookup_url_kwarg)
         if code != None:
-            room = Room.objects.filter(code=code)
-            if len(room) > 0:
-                data = RoomSerializer(room[0]).data
-                data['is_host'] = self.request.session.session_key == room[0].host
-                
-                return Response(data, status=status.HTTP_200_OK)
+            room = Room.objects.filter(code=code).first()
+            if room is not None:
+                is_host = self.request.session.session_key == room.host
+                etag = make_etag('room', room.pk, room.updated_at, is_host)
+                response = not_modified(request, etag, room.updated_at)
+                if response is not None:
+                    return response
+
+                data = RoomSerializer(room).data
+                data['is_host'] = is_host
+
+                return add_validators(Response(data, status=status.HTTP_200_OK), etag, room.updated_at)
             return Response({'Room Not Found': 'Invalid Room Code.'}, status=status.HTTP_404_NOT_FOUND)
 
         return Response({'Bad Request': 'Code paramater not found in request'}, status=status.HTTP_400_BAD_REQUEST)
@@ -72,7 +122,7 @@ class CreateRoomView(APIView):
                 room = queryset[0]
                 room.guest_can_pause = guest_can_pause
                 room.votes_to_skip = votes_to_skip
-                room.save(update_fields=["guest_can_pause", "votes_to_skip"])
+                room.save(update_fields=["guest_can_pause", "votes_to_skip", "updated_at"])
                 self.request.session['room_code'] =room.code
             else:
                 # If no room exists for the host, create a new one
@@ -91,9 +141,6 @@ class UserInRoom(APIView):
         if not self.request.session.exists(self.request.session.session_key):
             self.request.session.create()
         
-        # Debug log to check session content
-        print("Session data:", self.request.session.items())
-        
         # Retrieve room_code from session
         room_code = self.request.session.get('room_code')
         
@@ -145,7 +192,7 @@ class UpdateRoom(APIView):
             # Update the room details
             room.guest_can_pause = guest_can_pause
             room.votes_to_skip = votes_to_skip
-            room.save(update_fields=['guest_can_pause', 'votes_to_skip'])
+            room.save(update_fields=['guest_can_pause', 'votes_to_skip', 'updated_at'])
 
             # Return the updated room details
             return Response(RoomSerializer(room).data, status=status.HTTP_200_OK)
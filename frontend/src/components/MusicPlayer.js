@@ -1,10 +1,33 @@
-import React from "react";
+import React, { useState, useEffect } from "react";
 import { Grid, Typography, Card, CardContent, IconButton, LinearProgress } from "@mui/material";
 import PlayArrowIcon from "@mui/icons-material/PlayArrow";
 import SkipNextIcon from "@mui/icons-material/SkipNext";
 import PauseIcon from "@mui/icons-material/Pause";
 
+// Playback position now, advanced locally from the last state the server sent.
+// Album art is drawn this wide; the server picks the image by size in device pixels.
+export const ALBUM_ART_WIDTH = 200;
+export const albumArtSize = () => Math.round(ALBUM_ART_WIDTH * (window.devicePixelRatio || 1));
+
+export const currentProgress = (song, now = Date.now()) => {
+  if (!song.is_playing) {
+    return song.progress_ms;
+  }
+  return Math.min(song.progress_ms + (now - (song.received_at ?? now)), song.duration_ms);
+};
+
 const MusicPlayer = ({ song }) => {
+  const [now, setNow] = useState(Date.now());
+
+  // Move the progress bar between server updates while the track plays.
+  useEffect(() => {
+    if (!song || !song.is_playing) {
+      return undefined;
+    }
+    const timer = setInterval(() => setNow(Date.now()), 500);
+    return () => clearInterval(timer);
+  }, [song]);
+
   if (!song || !song.title) {
     return (
       <Grid container justifyContent="center" alignItems="center" sx={{ height: "100vh" }}>
@@ -47,11 +70,16 @@ const MusicPlayer = ({ song }) => {
               {/* Song Title */}
               <Grid item xs={12} align="center">
                 <Typography variant="h6">Now Playing: {song.title}</Typography>
+                {song.stale && (
+                  <Typography variant="caption" color="text.secondary">
+                    Spotify is not responding, showing the last known song
+                  </Typography>
+                )}
               </Grid>
 
               {/* Album Image */}
               <Grid item xs={12} align="center">
-                <img src={song.album_image} alt="Album Cover" width="200" style={{ borderRadius: "8px" }} />
+                <img src={song.album_image} alt="Album Cover" width={ALBUM_ART_WIDTH} style={{ borderRadius: "8px" }} />
               </Grid>
 
               {/* Artist Name */}
@@ -79,7 +107,7 @@ const MusicPlayer = ({ song }) => {
               <Grid item xs={12}>
                 <LinearProgress
                   variant="determinate"
-                  value={(song.progress_ms / song.duration_ms) * 100}
+                  value={(currentProgress(song, now) / song.duration_ms) * 100}
                   sx={{ borderRadius: 5, height: 10 }}
                 />
               </Grid>
@@ -1,7 +1,7 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { useParams, useNavigate } from "react-router-dom";
 import { Grid, Button, Typography } from "@mui/material";
-import MusicPlayer from "./MusicPlayer"; // ✅ Import the new component
+import MusicPlayer, { albumArtSize, currentProgress } from "./MusicPlayer"; // ✅ Import the new component
 
 const Room = ({ leaveRoomCallback }) => {
   const { roomCode } = useParams();
@@ -13,6 +13,30 @@ const Room = ({ leaveRoomCallback }) => {
   const [showSettings, setShowSettings] = useState(false);
   const [spotifyAuthenticated, setSpotifyAuthenticated] = useState(false);
   const [song, setSong] = useState(null);
+  const songEtag = useRef(null); // Validator of the last current-song response
+  const songRef = useRef(null); // Latest song, for scheduling polls
+
+  // Show a state from the server, stamped with when it arrived so the player
+  // can advance the progress bar from it. States older than the one shown
+  // (e.g. a poll overtaken by a pushed update) are ignored.
+  const showSong = (data) => {
+    const next = data && Object.keys(data).length > 0 ? { ...data, received_at: Date.now() } : null;
+    if (next && songRef.current && next.server_time < songRef.current.server_time) {
+      return;
+    }
+    songRef.current = next;
+    setSong(next);
+  };
+
+  // Poll again around the end of the track, but at least every 15 seconds so
+  // pauses and votes by others still show up.
+  const nextPollDelay = (current) => {
+    if (!current || !current.is_playing) {
+      return 10000;
+    }
+    const remaining = current.duration_ms - currentProgress(current);
+    return Math.max(1000, Math.min(remaining + 500, 15000));
+  };
 
   // Fetch Room Details
   const getRoomDetails = async () => {
@@ -68,25 +92,33 @@ const Room = ({ leaveRoomCallback }) => {
   // Fetch Current Song
   const getCurrentSong = async () => {
     try {
-        const response = await fetch("/spotify/current-song"); // All users call this endpoint
+        // All users call this endpoint. The validator is sent by hand (and the
+        // browser cache bypassed) so an unchanged song comes back as a bare 304.
+        const response = await fetch(`/spotify/current-song?art_size=${albumArtSize()}`, {
+            headers: songEtag.current ? { "If-None-Match": songEtag.current } : {},
+            cache: "no-store",
+        });
+        if (response.status === 304) {
+            // Same song, votes and play state; the player keeps advancing progress itself.
+            return;
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! Status: ${response.status}`);
         }
+        songEtag.current = response.headers.get("ETag");
         const text = await response.text(); //  Convert to text first
 
         if (!text) {
             console.log("No song data received (empty response).");
-            setSong(null);
+            showSong(null);
             return;
         }
 
         const data = JSON.parse(text); //  Safely parse JSON
         if (!data || Object.keys(data).length === 0) {
             console.log("No song is currently playing.");
-            setSong(null);
-        } else {
-            setSong(data);
         }
+        showSong(data);
     } catch (error) {
         console.error("Error fetching current song:", error);
     }
@@ -109,11 +141,51 @@ const Room = ({ leaveRoomCallback }) => {
     getCurrentSong(); // 🔥 Fetch song immediately when the room loads
   }, [roomCode]);
 
-  // Fetch Current Song Every 5 Seconds
+  // Receive song updates pushed by the server, falling back to polling timed by the track
   useEffect(() => {
-    const interval = setInterval(getCurrentSong, 5000); // ✅ Fetch every 5 seconds
-    return () => clearInterval(interval);
-  }, []);
+    let timer = null;
+    let stopped = false;
+    const poll = async () => {
+      await getCurrentSong();
+      if (!stopped) {
+        timer = setTimeout(poll, nextPollDelay(songRef.current));
+      }
+    };
+    const startPolling = () => {
+      if (!timer) {
+        timer = setTimeout(poll, nextPollDelay(songRef.current));
+      }
+    };
+
+    if (!window.EventSource) {
+      startPolling();
+      return () => {
+        stopped = true;
+        clearTimeout(timer);
+      };
+    }
+
+    const source = new EventSource(`/spotify/events?art_size=${albumArtSize()}`);
+    source.onmessage = (event) => {
+      showSong(JSON.parse(event.data));
+    };
+    source.addEventListener("closed", () => {
+      source.close();
+      leaveRoomCallback?.();
+      navigate("/");
+    });
+    source.onerror = () => {
+      // Stream unavailable (e.g. WSGI deployment) or dropped: poll instead.
+      source.close();
+      startPolling();
+    };
+
+    return () => {
+      stopped = true;
+      source.close();
+      clearTimeout(timer);
+    };
+  }, [roomCode]);
 
   return (
     <Grid container spacing={1}>
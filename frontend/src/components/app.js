@@ -1,18 +1,22 @@
-import React from "react";
+import React, { lazy, Suspense } from "react";
 import { Routes, Route } from "react-router-dom";
 import HomePage from "./HomePage";
-import JoinRoom from "./JoinRoom";
-import CreateRoom from "./CreateRoom";
-import Room from "./Room";
+
+// Each route below is its own chunk, fetched the first time it is visited.
+const JoinRoom = lazy(() => import(/* webpackChunkName: "join-room" */ "./JoinRoom"));
+const CreateRoom = lazy(() => import(/* webpackChunkName: "create-room" */ "./CreateRoom"));
+const Room = lazy(() => import(/* webpackChunkName: "room" */ "./Room"));
 
 const App = () => {
   return (
-    <Routes className="center">
-      <Route path="/" element={<HomePage />} />
-      <Route path="/join" element={<JoinRoom />} />
-      <Route path="/create" element={<CreateRoom />} />
-      <Route path="/room/:roomCode" element={<Room />} />
-    </Routes>
+    <Suspense fallback={null}>
+      <Routes className="center">
+        <Route path="/" element={<HomePage />} />
+        <Route path="/join" element={<JoinRoom />} />
+        <Route path="/create" element={<CreateRoom />} />
+        <Route path="/room/:roomCode" element={<Room />} />
+      </Routes>
+    </Suspense>
   );
 };
 
@@ -8,7 +8,14 @@ module.exports = (env, argv) => {
     entry: './src/index.js',
     output: {
       path: path.resolve(__dirname, './static/frontend'),
+      publicPath: '/static/frontend/',
+      // The entry keeps a fixed name for {% static %}; collectstatic's manifest
+      // storage gives it a content hash (and, with WhiteNoise, writes the .gz and
+      // .br copies under that hashed name). Lazily loaded route chunks are named
+      // by webpack's runtime, so they carry their own content hash.
       filename: 'main.js',
+      chunkFilename: isProduction ? '[name].[contenthash:8].js' : '[name].js',
+      clean: isProduction,
     },
     module: {
       rules: [
@@ -0,0 +1,16 @@
+"""Shared-secret access to the operational endpoints (/metrics, /debug/traces, X-Trace)."""
+import hmac
+
+
+def has_bearer_token(request, token):
+    """
+    Whether the request carries `Authorization: Bearer <token>`.
+
+    The peer address proves nothing behind a reverse proxy on the same host,
+    where every client is 127.0.0.1, so these endpoints ask for a secret
+    instead; with no token configured nobody gets in.
+    """
+    if not token:
+        return False
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(credentials.strip().encode(), token.encode())
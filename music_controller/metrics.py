@@ -0,0 +1,197 @@
+"""
+In-process Prometheus metrics, exposed in the text format at /metrics.
+
+Each process keeps its own counts, so scrape every worker (or run one worker
+per scrape target); there is no cross-process aggregation. Recording a sample
+is a dictionary lookup and an add under a lock, cheap enough for every
+request and every Spotify call.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from .access import has_bearer_token
+
+_metrics = []  # Every metric, in registration order, for rendering
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _sample(name, label_text, value):
+    return f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield _sample(self.name, _labels(self.labelnames, labels), value)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        _metrics.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = [(labels, list(series)) for labels, series in self._values.items()]
+        for labels, series in values:
+            label_text = _labels(self.labelnames, labels)
+            prefix = label_text + "," if label_text else ""
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                cumulative += count
+                yield f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}'
+            yield _sample(f"{self.name}_sum", label_text, series[-1])
+            yield _sample(f"{self.name}_count", label_text, cumulative)
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to produce a response, by view route and method.", ("view", "method"),
+)
+http_responses = Counter(
+    "http_responses_total", "Responses sent, by view route, method and status code.", ("view", "method", "status"),
+)
+http_request_queries = Histogram(
+    "http_request_db_queries", "Database queries run by one request, by view route.", ("view",), QUERY_BUCKETS,
+)
+spotify_request_duration = Histogram(
+    "spotify_request_duration_seconds", "Time for one upstream Spotify call, by host and path.", ("host", "path"),
+)
+spotify_responses = Counter(
+    "spotify_responses_total",
+    "Upstream Spotify calls, by host, path and status code ('error' when no response arrived).",
+    ("host", "path", "status"),
+)
+spotify_retries = Counter(
+    "spotify_retries_total", "Spotify calls retried, by the status that caused the retry.", ("reason",),
+)
+spotify_token_refreshes = Counter(
+    "spotify_token_refreshes_total", "Spotify token refresh attempts, by outcome.", ("outcome",),
+)
+cleanup_deleted = Counter(
+    "cleanup_deleted_total", "Stale rows deleted by cleanup, by kind (sessions, rooms, votes, tokens).", ("kind",),
+)
+
+
+# Paths carrying an id are collapsed to one label each, so label sets stay bounded.
+_ID_PATHS = [
+    (re.compile(r"/image/[^/]+$"), "/image/:id"),  # Album art on Spotify's CDN
+]
+
+
+def path_label(path):
+    for pattern, label in _ID_PATHS:
+        path, replaced = pattern.subn(label, path)
+        if replaced:
+            break
+    return path
+
+
+def observe_spotify_call(host, path, status, seconds):
+    """Client hook: record one upstream call; `status` is the HTTP status or 'error'."""
+    path = path_label(path)
+    spotify_request_duration.observe(seconds, host, path)
+    spotify_responses.inc(host, path, status)
+
+
+def render():
+    return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
+
+
+class QueryCounter:
+    """connection.execute_wrapper that counts the queries run inside it."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _view_label(request):
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    """Record latency, status and (for sync views) query count of every request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started)
+        http_request_queries.observe(queries.count, _view_label(request))
+        return response
+
+    async def __acall__(self, request):
+        # Queries of async views run on other threads' connections, so only timing is kept.
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, seconds):
+        view = _view_label(request)
+        http_request_duration.observe(seconds, view, request.method)
+        http_responses.inc(view, request.method, response.status_code)
+
+
+def metrics_view(request):
+    if not has_bearer_token(request, settings.METRICS_TOKEN):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
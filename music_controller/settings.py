@@ -12,6 +12,11 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 import os
 from pathlib import Path
 
+try:
+    import whitenoise  # Optional: serves static files with compression and far-future caching
+except ImportError:
+    whitenoise = None
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'music_controller.metrics.MetricsMiddleware',  # Outermost, so its timings cover the other middleware
+    'music_controller.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,12 +59,21 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+if whitenoise is not None:
+    MIDDLEWARE.insert(3, 'whitenoise.middleware.WhiteNoiseMiddleware')  # Right after SecurityMiddleware
 
 ROOT_URLCONF = 'music_controller.urls'
-SESSION_ENGINE = "django.contrib.sessions.backends.db"  # Use database storage
+# Session keys identify hosts and voters, so the session must keep a stable key:
+# db, cache or cached_db work; signed_cookies does not. cached_db needs a cache
+# shared by every worker (REDIS_URL below): with the per-process default cache
+# one worker would keep serving a session another worker has since changed.
+SESSION_ENGINE = os.environ.get(
+    "SESSION_ENGINE",
+    "django.contrib.sessions.backends.cached_db" if os.environ.get("REDIS_URL") else "django.contrib.sessions.backends.db",
+)  # With a shared cache, reads come from it and writes go through to the database
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 7  # Sessions last 7 days
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # Keep session even if the browser is closed
-SESSION_SAVE_EVERY_REQUEST = True  # Save session on every request
+SESSION_SAVE_EVERY_REQUEST = False  # Save a session only when it changes, not on every poll
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -80,12 +96,55 @@ WSGI_APPLICATION = 'music_controller.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default, tuned with WAL and pragmas in api/db.py. Setting POSTGRES_DB
+# switches to PostgreSQL, e.g. against a local container:
+#   docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+#   POSTGRES_DB=postgres POSTGRES_PASSWORD=postgres python manage.py test
+# (the PostgreSQL backend needs psycopg installed).
+
+# Persistent connections help WSGI workers only; under ASGI (needed for the event
+# stream and async views) Django's docs say to keep them off, so they default to off.
+DATABASE_CONN_MAX_AGE = int(os.environ.get("DATABASE_CONN_MAX_AGE", "0"))  # Seconds a connection is reused across requests; 0 closes it after each
+
+if os.environ.get("POSTGRES_DB"):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ["POSTGRES_DB"],
+            'USER': os.environ.get("POSTGRES_USER", "postgres"),
+            'PASSWORD': os.environ.get("POSTGRES_PASSWORD", ""),
+            'HOST': os.environ.get("POSTGRES_HOST", "localhost"),
+            'PORT': os.environ.get("POSTGRES_PORT", "5432"),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,  # Replace connections the server dropped while idle
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'OPTIONS': {
+                'timeout': 20,  # Seconds a writer waits for the database lock before failing
+            },
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# Per-process local memory by default. Setting REDIS_URL (e.g. redis://localhost:6379/0)
+# shares the cache between workers, which cached_db sessions require and which
+# lets workers share now-playing payloads (needs the redis package installed).
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ["REDIS_URL"],
+        }
     }
-}
 
 
 # Password validation
@@ -129,9 +188,126 @@ STATICFILES_DIRS = [
 ]
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'  # Where static files will be collected in production
+
+if not DEBUG:
+    # collectstatic stores content-hashed copies and a manifest that {% static %}
+    # resolves names through, so every asset URL can be cached indefinitely.
+    # WhiteNoise's storage also writes gzip (and, with the brotli package,
+    # brotli) copies under the hashed names; without WhiteNoise, compression is
+    # left to the web server in front.
+    STORAGES = {
+        "default": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+        },
+        "staticfiles": {
+            "BACKEND": (
+                "whitenoise.storage.CompressedManifestStaticFilesStorage" if whitenoise is not None
+                else "django.contrib.staticfiles.storage.ManifestStaticFilesStorage"
+            ),
+        },
+    }
+
+# Served with a one-year immutable Cache-Control: Django's 12-character and
+# webpack's 8-character content hashes in file names.
+WHITENOISE_IMMUTABLE_FILE_TEST = r"\.[0-9a-f]{8}(?:[0-9a-f]{4})?\.\w+(?:\.(?:gz|br))?$"
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 APPEND_SLASH = False
+
+# Rooms
+ROOM_ACTIVE_WINDOW = 60 * 60  # Seconds since its last change that a room counts as active in the room list
+ROOM_LIST_PAGE_SIZE = 50  # Rooms per page of the room list; clients may ask for up to 200
+
+# Cleanup of stale sessions, rooms, votes and tokens (spotify/cleanup.py, `manage.py cleanup`)
+CLEANUP_INTERVAL = None  # Seconds between background cleanup runs in every web process; None leaves it to `manage.py cleanup` (e.g. from cron)
+CLEANUP_ROOM_IDLE = 60 * 60 * 24  # Seconds without changes before a room whose host's session is gone is deleted
+CLEANUP_BATCH_SIZE = 500  # Rows per DELETE statement
+CLEANUP_BATCH_PAUSE = 0.05  # Seconds between batches, leaving room for other writers
+
+# Spotify
+SPOTIFY_API_URL = "https://api.spotify.com/v1/"
+SPOTIFY_ACCOUNTS_URL = "https://accounts.spotify.com/"
+SPOTIFY_HTTP_POOL_SIZE = {  # Keep-alive connections kept per host
+    "api.spotify.com": 20,
+    "accounts.spotify.com": 4,
+    "default": 10,
+}
+SPOTIFY_HTTP_CONNECT_TIMEOUT = 3.05  # Seconds to establish a connection to Spotify
+SPOTIFY_HTTP_READ_TIMEOUT = 10  # Seconds to wait for Spotify to send response data
+SPOTIFY_RATE_LIMIT = {  # (calls per second, burst) allowed per host; None means unlimited
+    "api.spotify.com": (10, 20),
+    "accounts.spotify.com": (2, 5),
+    "default": None,
+}
+SPOTIFY_RATE_LIMIT_WAIT = 2  # Longest a call waits for a rate-limit slot or a short Retry-After
+SPOTIFY_CIRCUIT_FAILURES = 5  # Consecutive failures (errors, timeouts, 5xx) that open a host's circuit
+SPOTIFY_CIRCUIT_RESET = 30  # Seconds an open circuit refuses calls before letting a trial call through
+SPOTIFY_TOKEN_REFRESH_MARGIN = 300  # Refresh tokens this many seconds before they expire
+SPOTIFY_TOKEN_REFRESH_INTERVAL = 60  # Seconds between background sweeps for expiring tokens
+SPOTIFY_TOKEN_REFRESH_MAX_BACKOFF = 60 * 60  # Longest wait before retrying a token whose background refresh keeps failing
+SPOTIFY_TOKEN_REFRESH_LOCK_TIMEOUT = 15  # Seconds a process may hold a session's refresh lock in the cache (outlasts the HTTP timeouts)
+SPOTIFY_ASYNC_VIEWS = os.environ.get("SPOTIFY_ASYNC_VIEWS") == "1"  # Serve playback endpoints with async views (needs httpx + ASGI)
+SPOTIFY_ASYNC_MAX_CONNECTIONS = 200  # Concurrent upstream connections per event loop for async views
+SPOTIFY_BACKGROUND_TASKS = True  # Run the playback scheduler and token refresher threads
+SPOTIFY_NOW_PLAYING_TTL = 3  # Seconds a room's now-playing payload is shared between pollers
+SPOTIFY_STALE_TTL = 60 * 60  # Seconds the last good payload is kept to serve while Spotify is unavailable
+SPOTIFY_POLL_MIN = 1  # Shortest gap between two polls of a room's playback
+SPOTIFY_POLL_MAX = 15  # Longest gap while a track plays; polls otherwise land at track end
+SPOTIFY_POLL_PAUSED = 10  # Gap between polls while the host is paused
+SPOTIFY_POLL_IDLE = 15  # Gap between polls while nothing is playing or Spotify errors
+SPOTIFY_LISTENER_TIMEOUT = 30  # Seconds after its last poll that a room stops being scheduled
+SPOTIFY_PUSH_KEEPALIVE = 15  # Seconds of silence before an event stream sends a keepalive
+SPOTIFY_BATCH_MAX_ROOMS = 50  # Most rooms one now-playing batch request may ask for
+SPOTIFY_BATCH_WORKERS = 8  # Threads fetching uncached rooms for one batch request
+ALBUM_ART_URL = "https://i.scdn.co/image/"  # Spotify's image CDN; images under it can be proxied
+ALBUM_ART_PROXY = os.environ.get("ALBUM_ART_PROXY") == "1"  # Serve album art from /spotify/album-art/<id> and a local disk cache
+ALBUM_ART_CACHE_DIR = os.environ.get("ALBUM_ART_CACHE_DIR", str(BASE_DIR / "album-art-cache"))  # Where proxied images are kept
+ALBUM_ART_CACHE_MAX_BYTES = 200 * 1024 * 1024  # Disk the image cache may use before least recently served images go
+
+
+# Metrics
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")  # Bearer token Prometheus sends to scrape /metrics; unset disables it
+TRACE_TOKEN = os.environ.get("TRACE_TOKEN")  # Bearer token that makes X-Trace honoured and /debug/traces readable; unset disables both
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))  # Share of all requests traced without asking
+TRACE_FILE = os.environ.get("TRACE_FILE")  # Append finished traces here as JSON lines; unset keeps them in memory only
+
+
+# Logging
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")  # Level for the project's own loggers
+SPOTIFY_LOG_SAMPLE_RATE = float(os.environ.get("SPOTIFY_LOG_SAMPLE_RATE", "0.01"))  # Share of per-request Spotify debug lines kept
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "keyvalue": {
+            "format": "time=%(asctime)s level=%(levelname)s logger=%(name)s thread=%(threadName)s msg=%(message)s",
+        },
+    },
+    "filters": {
+        "sampled": {
+            "()": "spotify.log.SampleFilter",
+            "rate": SPOTIFY_LOG_SAMPLE_RATE,
+        },
+    },
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+            "formatter": "keyvalue",
+        },
+        "sampled_console": {
+            "class": "logging.StreamHandler",
+            "formatter": "keyvalue",
+            "filters": ["sampled"],
+        },
+    },
+    "loggers": {
+        "api": {"handlers": ["console"], "level": LOG_LEVEL},
+        "spotify": {"handlers": ["console"], "level": LOG_LEVEL},
+        "spotify.poll": {"handlers": ["sampled_console"], "level": LOG_LEVEL, "propagate": False},
+    },
+}
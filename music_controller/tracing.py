@@ -0,0 +1,170 @@
+"""
+Opt-in per-request tracing: nested timing spans, optionally with a cProfile.
+
+A request is traced when it carries an `X-Trace` header along with
+`Authorization: Bearer <TRACE_TOKEN>` (`X-Trace: profile` also runs cProfile
+around it), or at random for a TRACE_SAMPLE_RATE share of all requests. Code marks its phases
+with `with span("name", key=value):`; outside a traced request that is a
+context-variable lookup and nothing else. Every database query of a traced
+(sync) request becomes a span of its own.
+
+Finished traces are kept in memory for /debug/traces (which asks for the same
+token), appended as JSON lines
+to TRACE_FILE when it is set, and named in the response's X-Trace-Id header.
+"""
+import cProfile
+import io
+import json
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponseForbidden, JsonResponse
+from .access import has_bearer_token
+
+_current = ContextVar("trace_span", default=None)
+_recent = deque(maxlen=100)  # Latest finished traces, newest last
+_file_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "started", "finished", "children")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.finished = None
+        self.children = []
+
+    def to_dict(self, origin):
+        return {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 3),
+            "duration_ms": round(((self.finished or time.perf_counter()) - self.started) * 1000, 3),
+            **({"attrs": self.attrs} if self.attrs else {}),
+            **({"children": [child.to_dict(origin) for child in self.children]} if self.children else {}),
+        }
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a phase of the current request as a child of the enclosing span."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = _current.set(child)
+    try:
+        yield child
+    finally:
+        child.finished = time.perf_counter()
+        _current.reset(token)
+
+
+def _query_span(execute, sql, params, many, context):
+    with span("db", sql=sql[:200]):
+        return execute(sql, params, many, context)
+
+
+def _trace_mode(request):
+    """Return None, "trace" or "profile" for a request."""
+    requested = request.headers.get("X-Trace")
+    if requested and has_bearer_token(request, settings.TRACE_TOKEN):
+        return "profile" if requested == "profile" else "trace"
+    if settings.TRACE_SAMPLE_RATE and random.random() < settings.TRACE_SAMPLE_RATE:
+        return "trace"
+    return None
+
+
+def _profile_summary(profiler):
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(30)
+    return output.getvalue()
+
+
+def _finish(request, response, root, profiler=None):
+    root.finished = time.perf_counter()
+    trace = {
+        "id": uuid.uuid4().hex,
+        "time": time.time(),
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "root": root.to_dict(root.started),
+    }
+    if profiler is not None:
+        trace["profile"] = _profile_summary(profiler)
+
+    _recent.append(trace)
+    if settings.TRACE_FILE:
+        with _file_lock, open(settings.TRACE_FILE, "a") as trace_file:
+            trace_file.write(json.dumps(trace) + "\n")
+    response["X-Trace-Id"] = trace["id"]
+    return response
+
+
+class TracingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        mode = _trace_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        root = Span("request", {"path": request.path})
+        token = _current.set(root)
+        profiler = cProfile.Profile() if mode == "profile" else None
+        try:
+            with connection.execute_wrapper(_query_span):
+                if profiler is not None:
+                    response = profiler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return _finish(request, response, root, profiler)
+
+    async def __acall__(self, request):
+        # Async views query through other threads' connections, so no db spans;
+        # cProfile only sees one thread, so "profile" is treated as "trace".
+        if _trace_mode(request) is None:
+            return await self.get_response(request)
+
+        root = Span("request", {"path": request.path})
+        token = _current.set(root)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return _finish(request, response, root)
+
+
+def traces_view(request):
+    """The most recent traces, newest first; ?id= picks one."""
+    if not has_bearer_token(request, settings.TRACE_TOKEN):
+        return HttpResponseForbidden()
+    traces = list(reversed(_recent))
+    trace_id = request.GET.get("id")
+    if trace_id:
+        traces = [trace for trace in traces if trace["id"] == trace_id]
+    return JsonResponse({"traces": traces})
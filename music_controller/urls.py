@@ -16,9 +16,13 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from .metrics import metrics_view
+from .tracing import traces_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view),
+    path('debug/traces', traces_view),
     path('api/', include('api.urls')),
     path('', include('frontend.urls')),
     path('spotify/',include('spotify.urls'))
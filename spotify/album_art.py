@@ -0,0 +1,172 @@
+"""
+Album art sized for the client, optionally served through a local disk cache.
+
+Room states carry every image Spotify offers for the album; a request's
+`art_size` (the display size in physical pixels) picks the smallest image at
+least that wide, so a 200px player gets the 300px image rather than the 640px
+one. With ALBUM_ART_PROXY on, image URLs point at /spotify/album-art/<id>,
+which fetches each image once and keeps it in ALBUM_ART_CACHE_DIR, evicting the
+least recently served files beyond ALBUM_ART_CACHE_MAX_BYTES. Spotify image
+ids name fixed content, so responses are cacheable forever.
+"""
+import logging
+import os
+import tempfile
+from pathlib import Path
+from threading import Lock
+from django.conf import settings
+from requests.exceptions import RequestException
+from .client import client
+from .locks import StripedLocks
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+_image_lock = StripedLocks()  # One download per image at a time
+
+
+def parse_art_size(value):
+    """Display size in physical pixels from a request parameter, or None."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return None
+    return size if size > 0 else None
+
+
+def pick_image(images, size):
+    """The smallest image at least `size` wide; the largest when none is, or no size is given."""
+    if size is not None:
+        for image in images:  # Smallest first
+            if image["width"] >= size:
+                return image
+    return images[-1]
+
+
+def image_url(url):
+    """`url`, rewritten to the local proxy when it is enabled and the image is on Spotify's CDN."""
+    if settings.ALBUM_ART_PROXY and url.startswith(settings.ALBUM_ART_URL):
+        return f"/spotify/album-art/{url[len(settings.ALBUM_ART_URL):]}"
+    return url
+
+
+def for_display(state, size=None):
+    """A copy of a room state with album_image chosen for `size` and image URLs proxied if enabled."""
+    if not state or not state.get("album_images"):
+        return state
+    images = [{**image, "url": image_url(image["url"])} for image in state["album_images"]]
+    return {**state, "album_images": images, "album_image": pick_image(images, size)["url"]}
+
+
+def sniff_content_type(data):
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class AlbumArtCache:
+    """
+    Album images on disk, one file per Spotify image id.
+
+    A hit touches the file's mtime, so the mtime order is the LRU order. After
+    each download the cache's size is checked against max_bytes and the
+    least recently used files are deleted until it is back under 90% of it.
+    Files are written to a temporary name and renamed into place, so several
+    processes can share the directory.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._size = None  # Bytes on disk, counted on first use
+        self._size_lock = Lock()
+
+    def path(self, image_id):
+        return self.directory / image_id
+
+    def get(self, image_id):
+        """Return the cached file's path, downloading the image on a miss; raises RequestException."""
+        path = self.path(image_id)
+        with _image_lock(image_id):
+            try:
+                os.utime(path)
+                return path
+            except FileNotFoundError:
+                pass
+            data = self._download(image_id)
+            self._store(path, data)
+        self._evict(len(data))
+        return path
+
+    def _download(self, image_id):
+        response = client.get(settings.ALBUM_ART_URL + image_id)
+        response.raise_for_status()
+        return response.content
+
+    def _store(self, path, data):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _entries(self):
+        with os.scandir(self.directory) as entries:
+            return [
+                (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                for entry in entries if entry.is_file() and not entry.name.startswith(".")
+            ]
+
+    def _evict(self, added):
+        with self._size_lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += added
+            if self._size <= self.max_bytes:
+                return
+
+            # Other processes share the directory, so recount before deleting.
+            entries = sorted(self._entries())
+            self._size = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if self._size <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                self._size -= size
+
+
+_cache = None
+_cache_lock = Lock()
+
+
+def album_art_cache():
+    global _cache
+    with _cache_lock:
+        directory, max_bytes = Path(settings.ALBUM_ART_CACHE_DIR), settings.ALBUM_ART_CACHE_MAX_BYTES
+        if _cache is None or (_cache.directory, _cache.max_bytes) != (directory, max_bytes):
+            _cache = AlbumArtCache(directory, max_bytes)
+        return _cache
+
+
+def fetch_album_art(image_id):
+    """Return (path, content type) of a cached album image, or None if Spotify's CDN can't provide it."""
+    try:
+        path = album_art_cache().get(image_id)
+    except RequestException as error:
+        logger.warning("Album art unavailable image=%s error=%s", image_id, error)
+        return None
+    with open(path, "rb") as image_file:
+        return path, sniff_content_type(image_file.read(12))
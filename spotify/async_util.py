@@ -0,0 +1,169 @@
+"""
+Asyncio counterparts of the Spotify helpers in util.py and now_playing.py.
+
+Used by the async playback views (SPOTIFY_ASYNC_VIEWS), which need the
+optional httpx dependency. An upstream call here is an awaiting coroutine
+rather than a blocked worker thread, so one ASGI process can hold hundreds of
+in-flight Spotify requests.
+"""
+import asyncio
+import logging
+import time
+from urllib.parse import urlsplit
+from weakref import WeakKeyDictionary
+import httpx
+from requests.exceptions import RequestException
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from music_controller.metrics import observe_spotify_call, spotify_retries
+from .client import RateLimitExceeded, admit, rate_limiter, record_response
+from .locks import StripedLocks
+from .now_playing import (
+    NOW_PLAYING_ENDPOINT, build_room_state, cache_key, last_known_key, serve_now_playing, store_now_playing,
+)
+from .util import (
+    REFRESH_AND_RETRY, RETRY, auth_headers, get_cached_user_tokens, get_user_tokens, refresh_spotify_token, retry_action,
+    retry_wait, spotify_result,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSpotifyClient:
+    """
+    httpx-based client with pooled keep-alive connections and the same
+    timeouts, rate limiters and circuit breakers as the sync client. httpx
+    connections belong to the event loop that opened them, so each running
+    loop gets its own httpx.AsyncClient.
+    """
+
+    def __init__(self):
+        self._clients = WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.SPOTIFY_HTTP_READ_TIMEOUT, connect=settings.SPOTIFY_HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=settings.SPOTIFY_ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.SPOTIFY_HTTP_POOL_SIZE["api.spotify.com"],
+                ),
+            )
+        return client
+
+    async def request(self, method, url, **kwargs):
+        parts = urlsplit(url)
+        host = parts.hostname
+        breaker = admit(host)
+        try:
+            bucket = rate_limiter(host)
+            if bucket is not None and not await bucket.aacquire(settings.SPOTIFY_RATE_LIMIT_WAIT):
+                raise RateLimitExceeded(f"Rate limit for {host} exhausted")
+
+            started = time.perf_counter()
+            try:
+                response = await self._client().request(method, url, **kwargs)
+            except httpx.TransportError:
+                observe_spotify_call(host, parts.path, "error", time.perf_counter() - started)
+                breaker.record_failure()
+                raise
+            observe_spotify_call(host, parts.path, response.status_code, time.perf_counter() - started)
+            record_response(breaker, bucket, response)
+            return response
+        except BaseException:
+            # Includes CancelledError when the view is cancelled on client disconnect.
+            breaker.release_trial()
+            raise
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request("PUT", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+
+async_client = AsyncSpotifyClient()
+
+
+async def aexecute_spotify_api_request(session_id, endpoint, post_=False, put_=False):
+    """Async version of util.execute_spotify_api_request, sharing its response handling."""
+    tokens = get_cached_user_tokens(session_id) or await sync_to_async(get_user_tokens)(session_id)
+    if not tokens:
+        logger.warning("No Spotify token for API request session=%s endpoint=%s", session_id, endpoint)
+        return {'Error': 'User not authenticated'}
+
+    url = settings.SPOTIFY_API_URL + 'me/' + endpoint
+    method = 'POST' if post_ else 'PUT' if put_ else 'GET'
+
+    try:
+        response = await async_client.request(method, url, headers=auth_headers(tokens))
+        action = retry_action(response, session_id, endpoint)
+        if action == REFRESH_AND_RETRY:
+            refreshed = await sync_to_async(refresh_spotify_token)(session_id, tokens.access_token)
+            if refreshed and refreshed.access_token != tokens.access_token:
+                spotify_retries.inc("401")
+                response = await async_client.request(method, url, headers=auth_headers(refreshed))
+        elif action == RETRY:
+            await asyncio.sleep(retry_wait(response))
+            response = await async_client.request(method, url, headers=auth_headers(tokens))
+        return spotify_result(response, endpoint)
+
+    except (httpx.HTTPError, RequestException) as e:
+        logger.warning("Spotify unavailable endpoint=%s error=%s", endpoint, e)
+        return {'Error': f"Spotify unavailable: {e}", 'Unavailable': True}
+
+    except Exception as e:
+        logger.exception("Unexpected error calling Spotify endpoint=%s", endpoint)
+        return {'Error': f"Unexpected error: {str(e)}"}
+
+
+# Per event loop: asyncio locks belong to the loop that first uses them.
+_room_locks = WeakKeyDictionary()
+
+
+def _room_lock(room_code):
+    loop = asyncio.get_running_loop()
+    locks = _room_locks.get(loop)
+    if locks is None:
+        locks = _room_locks[loop] = StripedLocks(asyncio.Lock)
+    return locks(room_code)
+
+
+async def _aserve(room_code, entry):
+    fetched_at, response = entry
+    last_known = await cache.aget(last_known_key(room_code)) if response.get("Unavailable") else None
+    return serve_now_playing(fetched_at, response, last_known)
+
+
+async def aget_now_playing(room):
+    """Async version of now_playing.get_now_playing, sharing its cache."""
+    key = cache_key(room.code)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return await _aserve(room.code, cached)
+
+    async with _room_lock(room.code):
+        cached = await cache.aget(key)
+        if cached is None:
+            response = await aexecute_spotify_api_request(room.host, NOW_PLAYING_ENDPOINT)
+            await sync_to_async(store_now_playing)(room.code, response)
+            cached = (time.time(), response)
+
+    return await _aserve(room.code, cached)
+
+
+async def ainvalidate_now_playing(room_code):
+    """Async version of now_playing.invalidate_now_playing."""
+    await cache.adelete(cache_key(room_code))
+
+
+async def aget_room_state(room):
+    """Async version of now_playing.get_room_state."""
+    response = await aget_now_playing(room)
+    return await sync_to_async(build_room_state)(room, response)
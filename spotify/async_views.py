@@ -0,0 +1,109 @@
+"""
+Async variants of the playback views, routed in place of the DRF views when
+SPOTIFY_ASYNC_VIEWS is on and the project is served through asgi.py.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from api.conditional import add_validators, not_modified
+from api.models import Room
+from .album_art import for_display, parse_art_size
+from .async_util import aexecute_spotify_api_request, aget_room_state, ainvalidate_now_playing
+from .now_playing import state_etag
+from .scheduler import scheduler
+from .skips import skip_queue
+from .votes import ALREADY_VOTED, SKIP, cast_skip_vote
+
+
+async def get_session_room(request):
+    """Return the request's room, or an error response if it is not in one."""
+    room_code = await sync_to_async(request.session.get)("room_code")
+    if not room_code:
+        return None, JsonResponse({"error": "User is not in a room"}, status=status.HTTP_400_BAD_REQUEST)
+
+    room = await Room.objects.filter(code=room_code).afirst()
+    if room is None:
+        return None, JsonResponse({"error": "Room not found"}, status=status.HTTP_404_NOT_FOUND)
+    return room, None
+
+
+async def send_playback_command(room, endpoint, post_=False, put_=False):
+    await aexecute_spotify_api_request(room.host, endpoint, post_=post_, put_=put_)
+    await ainvalidate_now_playing(room.code)
+    scheduler.poke(room.code)
+
+
+# DRF's APIView exempts its views from CSRF checks; these match that.
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncPlaybackView(View):
+    pass
+
+
+class AsyncCurrentSong(AsyncPlaybackView):
+    async def get(self, request, format=None):
+        room, error = await get_session_room(request)
+        if error:
+            return error
+
+        song = await aget_room_state(room)
+        scheduler.touch(room.code)
+        if song is None:
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+        etag = state_etag(song)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        song = for_display(song, parse_art_size(request.GET.get("art_size")))
+        return add_validators(JsonResponse(song, status=status.HTTP_200_OK), etag)
+
+
+class AsyncPauseSong(AsyncPlaybackView):
+    async def put(self, request, format=None):
+        room, error = await get_session_room(request)
+        if error:
+            return error
+
+        if request.session.session_key == room.host or room.guest_can_pause:
+            await send_playback_command(room, "player/pause", put_=True)
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+        return JsonResponse({"error": "Not authorized to pause song"}, status=status.HTTP_403_FORBIDDEN)
+
+
+class AsyncPlaySong(AsyncPlaybackView):
+    async def put(self, request, format=None):
+        room, error = await get_session_room(request)
+        if error:
+            return error
+
+        if request.session.session_key == room.host or room.guest_can_pause:
+            await send_playback_command(room, "player/play", put_=True)
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+        return JsonResponse({"error": "Not a premium User"}, status=status.HTTP_403_FORBIDDEN)
+
+
+class AsyncSkipSong(AsyncPlaybackView):
+    async def post(self, request, format=None):
+        room, error = await get_session_room(request)
+        if error:
+            return error
+
+        song_id = room.current_song
+        if not song_id:
+            return JsonResponse({"error": "No song is currently playing"}, status=status.HTTP_400_BAD_REQUEST)
+
+        outcome = await sync_to_async(cast_skip_vote)(room, request.session.session_key)
+        if outcome == ALREADY_VOTED:
+            return JsonResponse({"error": "You have already voted"}, status=status.HTTP_403_FORBIDDEN)
+
+        if outcome == SKIP:
+            await sync_to_async(skip_queue.submit)(room, song_id)
+        else:
+            await sync_to_async(scheduler.notify)(room)
+
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import close_old_connections
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from api.models import Room
+from music_controller.metrics import cleanup_deleted
+from .models import Spotify_token, Vote
+
+logger = logging.getLogger(__name__)
+
+DB_SESSION_ENGINES = ("django.contrib.sessions.backends.db", "django.contrib.sessions.backends.cached_db")
+
+
+def sessions_in_database():
+    """Whether django_session holds the live sessions, so hosts can be checked against it."""
+    return settings.SESSION_ENGINE in DB_SESSION_ENGINES
+
+
+def live_session(field, now):
+    return Exists(Session.objects.filter(session_key=OuterRef(field), expire_date__gt=now))
+
+
+def stale_querysets(now=None):
+    """
+    Return (kind, queryset) pairs of rows that are safe to delete, in the
+    order they should go.
+
+    - sessions: past their expire_date.
+    - rooms: unchanged for CLEANUP_ROOM_IDLE and the host's session is gone.
+      Without database sessions that can't be checked, so a room must also
+      have outlived the host's session cookie. Their votes go with them.
+    - votes: cast on a previous day for a song the room is no longer playing
+      (a skip that never got its votes cleared).
+    - tokens: no room is hosted by their session and that session is gone (or,
+      without database sessions, the token is older than CLEANUP_ROOM_IDLE).
+
+    Sessions go first so that the rooms and tokens they held become eligible in
+    the same run.
+    """
+    now = now or timezone.now()
+    idle = timedelta(seconds=settings.CLEANUP_ROOM_IDLE)
+    hosting = Exists(Room.objects.filter(host=OuterRef("user")))
+
+    if sessions_in_database():
+        rooms = Room.objects.filter(updated_at__lt=now - idle).exclude(live_session("host", now))
+        tokens = Spotify_token.objects.exclude(hosting).exclude(live_session("user", now))
+        querysets = [("sessions", Session.objects.filter(expire_date__lt=now))]
+    else:
+        idle = max(idle, timedelta(seconds=settings.SESSION_COOKIE_AGE))
+        rooms = Room.objects.filter(updated_at__lt=now - idle)
+        tokens = Spotify_token.objects.exclude(hosting).filter(created_at__lt=(now - idle).date())
+        querysets = []
+
+    votes = Vote.objects.filter(created_at__lt=now.date()).exclude(song_id=F("room__current_song"))
+    return querysets + [("rooms", rooms), ("votes", votes), ("tokens", tokens)]
+
+
+def delete_in_batches(queryset, batch_size, pause=0):
+    """
+    Delete a queryset's rows `batch_size` primary keys at a time and return the
+    number of rows deleted (cascades not included).
+
+    Each batch is its own short statement in autocommit, so no lock is held
+    for longer than one batch and writers get in between batches.
+    """
+    deleted = 0
+    while True:
+        batch = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        queryset.model.objects.filter(pk__in=batch).delete()
+        deleted += len(batch)
+        if len(batch) < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def run_cleanup(dry_run=False, batch_size=None, pause=None):
+    """Delete (or with dry_run, count) stale rows of every kind; return {kind: rows}."""
+    batch_size = batch_size or settings.CLEANUP_BATCH_SIZE
+    pause = settings.CLEANUP_BATCH_PAUSE if pause is None else pause
+    counts = {}
+    for kind, queryset in stale_querysets():
+        if dry_run:
+            counts[kind] = queryset.count()
+            continue
+        counts[kind] = delete_in_batches(queryset, batch_size, pause)
+        cleanup_deleted.inc(kind, amount=counts[kind])
+    return counts
+
+
+class Janitor:
+    """
+    Run run_cleanup() every CLEANUP_INTERVAL seconds in a background thread,
+    started alongside the playback scheduler. CLEANUP_INTERVAL = None leaves
+    cleanup to the `cleanup` management command (e.g. from cron).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if not settings.CLEANUP_INTERVAL:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="cleanup-janitor", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(settings.CLEANUP_INTERVAL)
+            close_old_connections()
+            try:
+                counts = run_cleanup()
+                logger.info("Cleanup finished %s", " ".join(f"{kind}={count}" for kind, count in counts.items()))
+            except Exception:
+                logger.exception("Background cleanup failed")
+            finally:
+                close_old_connections()
+
+
+janitor = Janitor()
@@ -0,0 +1,249 @@
+import asyncio
+import time
+from threading import Lock, local
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from music_controller.metrics import observe_spotify_call
+
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    """No call slot for a host became free within SPOTIFY_RATE_LIMIT_WAIT seconds."""
+
+
+class TokenBucket:
+    """
+    Allow `rate` calls per second to one host, in bursts of up to `burst`.
+
+    After a 429 the bucket is paused for the response's Retry-After, so every
+    caller in the process backs off together instead of each hitting the limit.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._lock = Lock()
+
+    def _reserve(self):
+        """Take a token and return 0, or return the seconds until one may be free."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout):
+        """Wait up to `timeout` seconds for a token; return whether one was taken."""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._reserve()
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, timeout):
+        """Async version of acquire()."""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._reserve()
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class CircuitOpen(requests.exceptions.RequestException):
+    """Calls to a host are refused while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stop calling a host that keeps failing.
+
+    After `threshold` consecutive failures (connection errors, timeouts or 5xx
+    responses) the circuit opens and calls fail at once for `reset_after`
+    seconds instead of tying up workers on a dead upstream. Then a single trial
+    call is let through: success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, threshold, reset_after):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_in_flight or time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Free the trial slot of a call that ended without an outcome, so the next call may try."""
+        with self._lock:
+            self.trial_in_flight = False
+
+
+_buckets = {}
+_buckets_lock = Lock()
+_breakers = {}
+_breakers_lock = Lock()
+
+
+def rate_limiter(host):
+    """Return the shared TokenBucket for a host, or None if calls to it are not limited."""
+    with _buckets_lock:
+        if host not in _buckets:
+            limits = settings.SPOTIFY_RATE_LIMIT
+            limit = limits.get(host, limits["default"])
+            _buckets[host] = TokenBucket(*limit) if limit else None
+        return _buckets[host]
+
+
+def circuit_breaker(host):
+    """Return the shared CircuitBreaker for a host."""
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(settings.SPOTIFY_CIRCUIT_FAILURES, settings.SPOTIFY_CIRCUIT_RESET)
+        return breaker
+
+
+def admit(host):
+    """Return the host's breaker, raising CircuitOpen if it is refusing calls."""
+    breaker = circuit_breaker(host)
+    if not breaker.allow():
+        raise CircuitOpen(f"Circuit breaker for {host} is open")
+    return breaker
+
+
+def record_response(breaker, bucket, response):
+    """Feed a response to the host's circuit breaker and rate limiter."""
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    if bucket is not None and response.status_code == 429:
+        bucket.pause(retry_after_seconds(response))
+
+
+def retry_after_seconds(response):
+    """Seconds a 429 response asks us to wait; Spotify sends whole seconds."""
+    try:
+        return max(float(response.headers.get("Retry-After", 1)), 0)
+    except ValueError:
+        return 1
+
+
+class SpotifyClient:
+    """
+    Shared HTTP client for every call to Spotify.
+
+    Connections are pooled per host and kept alive between calls, so a request
+    only pays the TCP and TLS handshake when its host's pool has no idle
+    connection. Each thread gets its own requests.Session (sessions carry
+    cookie state and are not thread-safe) but all sessions mount the same
+    per-host adapters, so the pools are shared process-wide. Every call gets
+    the configured connect/read timeouts unless the caller passes its own, and
+    waits for its host's rate limiter, raising RateLimitExceeded if no slot
+    frees up within SPOTIFY_RATE_LIMIT_WAIT seconds. While the host's circuit
+    breaker is open, calls raise CircuitOpen without touching the network.
+    """
+
+    def __init__(self):
+        self._adapters = {}
+        self._adapters_lock = Lock()
+        self._local = local()
+
+    def _adapter(self, origin):
+        with self._adapters_lock:
+            adapter = self._adapters.get(origin)
+            if adapter is None:
+                pool_sizes = settings.SPOTIFY_HTTP_POOL_SIZE
+                size = pool_sizes.get(urlsplit(origin).hostname, pool_sizes["default"])
+                adapter = self._adapters[origin] = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            return adapter
+
+    def _session(self, origin):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        prefix = origin + "/"
+        if prefix not in session.adapters:
+            session.mount(prefix, self._adapter(origin))
+        return session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (settings.SPOTIFY_HTTP_CONNECT_TIMEOUT, settings.SPOTIFY_HTTP_READ_TIMEOUT))
+        parts = urlsplit(url)
+        breaker = admit(parts.hostname)
+        try:
+            bucket = rate_limiter(parts.hostname)
+            if bucket is not None and not bucket.acquire(settings.SPOTIFY_RATE_LIMIT_WAIT):
+                raise RateLimitExceeded(f"Rate limit for {parts.hostname} exhausted")
+
+            started = time.perf_counter()
+            try:
+                response = self._session(f"{parts.scheme}://{parts.netloc}").request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                observe_spotify_call(parts.hostname, parts.path, "error", time.perf_counter() - started)
+                breaker.record_failure()
+                raise
+            observe_spotify_call(parts.hostname, parts.path, response.status_code, time.perf_counter() - started)
+            record_response(breaker, bucket, response)
+            return response
+        except BaseException:
+            # Rate limiting, other request errors and cancellation leave no outcome;
+            # a half-open breaker must not keep waiting for one.
+            breaker.release_trial()
+            raise
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+client = SpotifyClient()
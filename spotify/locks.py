@@ -0,0 +1,17 @@
+from threading import Lock
+
+
+class StripedLocks:
+    """
+    A fixed set of locks, one picked per key by hash.
+
+    Keys (sessions, rooms, images) come and go, but nothing has to be created
+    or cleaned up per key; two keys sharing a stripe only ever wait on each
+    other. `factory` makes the locks, e.g. asyncio.Lock.
+    """
+
+    def __init__(self, factory=Lock, stripes=64):
+        self._locks = [factory() for _ in range(stripes)]
+
+    def __call__(self, key):
+        return self._locks[hash(key) % len(self._locks)]
@@ -0,0 +1,18 @@
+import random
+import logging
+
+
+class SampleFilter(logging.Filter):
+    """
+    Pass roughly `rate` of the records below WARNING; warnings and errors always pass.
+
+    Attached to the per-request loggers (spotify.poll) so routine traffic can be
+    kept at DEBUG in production without one line per Spotify call.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
@@ -0,0 +1,83 @@
+import time
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from api.models import Room
+from spotify import util
+from spotify.models import Spotify_token
+from spotify.stub import StubSpotify
+
+CONFIGURATIONS = [
+    ("db, save every request", "django.contrib.sessions.backends.db", True),
+    ("db, save on change", "django.contrib.sessions.backends.db", False),
+    ("cached_db, save on change", "django.contrib.sessions.backends.cached_db", False),
+]
+
+
+def session_queries(context):
+    """Split captured django_session statements into (reads, writes)."""
+    statements = [q["sql"] for q in context.captured_queries if "django_session" in q["sql"]]
+    reads = sum(1 for sql in statements if sql.startswith("SELECT"))
+    return reads, len(statements) - reads
+
+
+class Command(BaseCommand):
+    help = "Count django_session reads and writes caused by current-song polling under each session configuration."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=20, help="Guests polling the room (default 20)")
+        parser.add_argument("--polls", type=int, default=10, help="Polls per guest (default 10)")
+
+    def handle(self, *args, **options):
+        clients, polls = options["clients"], options["polls"]
+        self.stdout.write(f"{clients} guests x {polls} polls of /spotify/current-song against a Spotify stub")
+
+        with StubSpotify() as stub, override_settings(SPOTIFY_API_URL=stub.api_url, SPOTIFY_BACKGROUND_TASKS=False):
+            for label, engine, save_every_request in CONFIGURATIONS:
+                with override_settings(SESSION_ENGINE=engine, SESSION_SAVE_EVERY_REQUEST=save_every_request):
+                    reads, writes, elapsed = self.run_polls(clients, polls)
+                total = clients * polls
+                self.stdout.write(
+                    f"{label:<28} session writes {writes:5d} ({writes / total:.2f}/poll)  "
+                    f"session reads {reads:5d} ({reads / total:.2f}/poll)  {total / elapsed:7.0f} polls/s"
+                )
+
+    def run_polls(self, clients, polls):
+        # Everything runs in one transaction that is rolled back, leaving the database untouched.
+        with transaction.atomic():
+            cache.clear()
+            util._token_cache.clear()
+            Spotify_token.objects.create(
+                user="bench-host",
+                access_token="access",
+                refresh_token="refresh",
+                token_type="Bearer",
+                expires_in=timezone.now() + timedelta(hours=1),
+            )
+            Room.objects.create(code="BENCHRM", host="bench-host")
+
+            guests = []
+            for _ in range(clients):
+                guest = Client(SERVER_NAME="localhost")
+                session = guest.session
+                session["room_code"] = "BENCHRM"
+                session.save()
+                guest.get("/spotify/current-song")  # Warm the session and now-playing caches
+                guests.append(guest)
+
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                for _ in range(polls):
+                    for guest in guests:
+                        guest.get("/spotify/current-song")
+                elapsed = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+
+        cache.clear()
+        util._token_cache.clear()
+        return (*session_queries(context), elapsed)
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from spotify.cleanup import run_cleanup, sessions_in_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions, abandoned rooms, leftover skip votes and orphaned Spotify tokens "
+        "in small batches. --dry-run only counts them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Count stale rows without deleting them")
+        parser.add_argument("--batch-size", type=int, help="Rows per DELETE statement (default CLEANUP_BATCH_SIZE)")
+        parser.add_argument("--pause", type=float, help="Seconds between batches (default CLEANUP_BATCH_PAUSE)")
+
+    def handle(self, *args, **options):
+        if not sessions_in_database():
+            self.stdout.write("Sessions are not stored in the database; rooms and tokens are judged by age alone.")
+
+        started = time.perf_counter()
+        counts = run_cleanup(dry_run=options["dry_run"], batch_size=options["batch_size"], pause=options["pause"])
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        for kind, count in counts.items():
+            self.stdout.write(f"{verb} {count:7d} {kind}")
+        self.stdout.write(f"Finished in {time.perf_counter() - started:.2f} s")
@@ -0,0 +1,167 @@
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from spotify import client as client_module, util
+from spotify.stub import StubSpotify
+from .bench_spotify_client import summarize
+
+
+class Recorder:
+    """Thread-safe latencies and status codes per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def call(self, label, send):
+        started = time.perf_counter()
+        try:
+            response = send()
+            status = response.status_code
+        except Exception:
+            response, status = None, "exception"
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[label].append(elapsed)
+            self.statuses[label][status] += 1
+        return response
+
+    def reset(self):
+        with self._lock:
+            self.latencies.clear()
+            self.statuses.clear()
+
+
+def new_client():
+    return Client(SERVER_NAME="localhost")
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the room and playback endpoints against a local Spotify stub: "
+        "create rooms through the auth flow, join guests with real sessions and "
+        "replay the frontend's polling and voting. Runs on a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=10, help="Rooms, each with its own host (default 10)")
+        parser.add_argument("--guests", type=int, default=20, help="Guests per room (default 20)")
+        parser.add_argument("--duration", type=float, default=20, help="Seconds of polling (default 20)")
+        parser.add_argument("--interval", type=float, default=1.0, help="Mean seconds between one client's polls (default 1)")
+        parser.add_argument("--vote-rate", type=float, default=0.01, help="Chance a guest votes to skip after a poll")
+        parser.add_argument("--latency", type=float, default=50, help="Stub response delay in milliseconds (default 50)")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub calls answered with a 503")
+        parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of stub calls answered with a 429")
+        parser.add_argument("--no-background", action="store_true", help="Disable the playback scheduler and token refresher")
+
+    def handle(self, *args, **options):
+        # A separate database keeps the load off real data; SQLite gets a file so
+        # client threads can share it.
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == "sqlite":
+                connection.settings_dict.setdefault("TEST", {})["NAME"] = str(Path(directory) / "loadtest.sqlite3")
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.run(options)
+            finally:
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        stub = StubSpotify(
+            latency=options["latency"] / 1000,
+            error_rate=options["error_rate"],
+            rate_limit_rate=options["rate_limit_rate"],
+        )
+        overrides = override_settings(
+            SPOTIFY_API_URL=stub.api_url,
+            SPOTIFY_ACCOUNTS_URL=stub.accounts_url,
+            SPOTIFY_BACKGROUND_TASKS=not options["no_background"],
+        )
+        for state in (cache, util._token_cache, client_module._buckets, client_module._breakers):
+            state.clear()
+
+        recorder = Recorder()
+        with stub, overrides:
+            started = time.perf_counter()
+            clients = [self.create_room(recorder, options["guests"]) for _ in range(options["rooms"])]
+            setup = time.perf_counter() - started
+            self.report("Setup: create rooms, authorize hosts, join guests", recorder, stub, setup)
+
+            recorder.reset()
+            stub.reset_counts()
+            deadline = time.monotonic() + options["duration"]
+            threads = [
+                threading.Thread(target=self.poll, args=(recorder, client, is_guest, deadline, options))
+                for room_clients in clients
+                for is_guest, client in ((False, room_clients[0]), *((True, guest) for guest in room_clients[1:]))
+            ]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.report(
+                f"Polling: {len(threads)} clients for {options['duration']:.0f} s", recorder, stub,
+                time.perf_counter() - started,
+            )
+
+    def create_room(self, recorder, guests):
+        """Walk one host through create-room and the Spotify callback, then join guests; return the clients."""
+        host = new_client()
+        response = recorder.call("POST /api/create-room", lambda: host.post(
+            "/api/create-room", {"guest_can_pause": True, "votes_to_skip": max(2, guests // 2)},
+            content_type="application/json",
+        ))
+        code = response.json()["code"]
+        recorder.call("GET /spotify/get-auth-url", lambda: host.get("/spotify/get-auth-url"))
+        recorder.call("GET /spotify/redirect", lambda: host.get("/spotify/redirect", {"code": "loadtest"}))
+
+        room_clients = [host]
+        for _ in range(guests):
+            guest = new_client()
+            recorder.call("POST /api/join-room", lambda: guest.post(
+                "/api/join-room", {"code": code}, content_type="application/json",
+            ))
+            room_clients.append(guest)
+        return room_clients
+
+    def poll(self, recorder, client, is_guest, deadline, options):
+        """Replay Room.js's polling fallback: conditional current-song GETs and the odd skip vote."""
+        etag = None
+        time.sleep(random.uniform(0, options["interval"]))  # Spread the clients out
+        try:
+            while time.monotonic() < deadline:
+                headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+                response = recorder.call("GET /spotify/current-song", lambda: client.get("/spotify/current-song", **headers))
+                if response is not None and response.status_code == 200:
+                    etag = response.get("ETag")
+
+                if is_guest and random.random() < options["vote_rate"]:
+                    recorder.call("POST /spotify/skip-song", lambda: client.post("/spotify/skip-song"))
+
+                time.sleep(random.uniform(0.5, 1.5) * options["interval"])
+        finally:
+            connections.close_all()
+
+    def report(self, title, recorder, stub, elapsed):
+        total = sum(len(latencies) for latencies in recorder.latencies.values())
+        self.stdout.write(f"\n{title}: {total} requests in {elapsed:.1f} s ({total / elapsed:,.0f} req/s)")
+        for label, latencies in sorted(recorder.latencies.items()):
+            mean, p50, p99 = summarize(latencies)
+            statuses = " ".join(f"{status}x{count}" for status, count in sorted(recorder.statuses[label].items(), key=str))
+            self.stdout.write(
+                f"  {label:<28} n={len(latencies):<6} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  mean {mean:7.2f} ms  [{statuses}]"
+            )
+        upstream = sum(stub.calls.values())
+        self.stdout.write(f"  Upstream Spotify calls: {upstream} ({upstream / max(total, 1):.3f} per request)")
+        for call, count in sorted(stub.calls.items()):
+            self.stdout.write(f"    {call:<40} {count}")
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_room_skip_votes'),
+        ('spotify', '0003_vote'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vote',
+            name='user',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('room', 'song_id', 'user'), name='unique_vote_per_song'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotify', '0004_vote_unique_per_song'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='spotify_token',
+            index=models.Index(fields=['expires_in'], name='spotify_token_expires_idx'),
+        ),
+    ]
@@ -10,10 +10,23 @@ class Spotify_token(models.Model):
     expires_in=models.DateTimeField()
     token_type=models.CharField(max_length=50)
 
+    class Meta:
+        indexes = [
+            # The token refresher's sweep for tokens about to expire.
+            models.Index(fields=["expires_in"], name="spotify_token_expires_idx"),
+        ]
+
 
 class Vote(models.Model):
-    user=models.CharField(max_length=50,unique=True)
+    user=models.CharField(max_length=50)
     created_at=models.DateField(auto_now_add=True)
     song_id=models.CharField(max_length=50)
     room =models.ForeignKey(Room, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            # One skip vote per guest per song; the insert doubles as the duplicate check.
+            # Its index also serves lookups by (room) and (room, song_id).
+            models.UniqueConstraint(fields=["room", "song_id", "user"], name="unique_vote_per_song"),
+        ]
     
\ No newline at end of file
@@ -0,0 +1,226 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from api.conditional import make_etag
+from api.models import Room
+from music_controller.tracing import span
+from .locks import StripedLocks
+from .models import Vote
+from .util import execute_spotify_api_request
+
+NOW_PLAYING_ENDPOINT = "player/currently-playing"
+
+# Serializes upstream fetches per room.
+_room_lock = StripedLocks()
+
+
+def cache_key(room_code):
+    return f"spotify:now-playing:{room_code}"
+
+
+def last_known_key(room_code):
+    return f"spotify:now-playing:last:{room_code}"
+
+
+def next_poll_delay(response):
+    """
+    Seconds until a room's playback is worth checking again.
+
+    While a track plays the next poll lands just after it should end, capped at
+    SPOTIFY_POLL_MAX so a host skipping in the Spotify app is still noticed.
+    Paused and idle rooms are checked on their own, slower, intervals.
+    """
+    if "Error" in response or response.get("item") is None:
+        return settings.SPOTIFY_POLL_IDLE
+    if not response.get("is_playing"):
+        return settings.SPOTIFY_POLL_PAUSED
+
+    remaining = (response["item"]["duration_ms"] - response.get("progress_ms", 0)) / 1000
+    return max(settings.SPOTIFY_POLL_MIN, min(remaining + 0.5, settings.SPOTIFY_POLL_MAX))
+
+
+def store_now_playing(room_code, response):
+    """
+    Cache a fresh payload until just past its next poll; return that delay.
+
+    Any payload Spotify actually answered is also kept as the room's last known
+    state for SPOTIFY_STALE_TTL seconds, to be served while Spotify is down.
+    """
+    delay = next_poll_delay(response)
+    entry = (time.time(), response)
+    cache.set(cache_key(room_code), entry, delay + settings.SPOTIFY_NOW_PLAYING_TTL)
+    if not response.get("Unavailable"):
+        cache.set(last_known_key(room_code), entry, settings.SPOTIFY_STALE_TTL)
+    return delay
+
+
+def fetch_now_playing(room):
+    """Call Spotify for the host's playback and store it; return (response, delay)."""
+    response = execute_spotify_api_request(room.host, NOW_PLAYING_ENDPOINT)
+    return response, store_now_playing(room.code, response)
+
+
+def with_elapsed(fetched_at, response):
+    """Advance progress_ms by the time the payload has spent in the cache."""
+    if not response.get("is_playing") or response.get("item") is None:
+        return response
+    progress = response.get("progress_ms", 0) + int((time.time() - fetched_at) * 1000)
+    return {**response, "progress_ms": min(progress, response["item"]["duration_ms"])}
+
+
+def serve_now_playing(fetched_at, response, last_known=None):
+    """
+    Prepare a cached payload for a reader.
+
+    When Spotify was unavailable, the last known payload is served instead,
+    marked "stale": True, rather than reporting that nothing is playing.
+    """
+    if response.get("Unavailable") and last_known is not None:
+        return {**with_elapsed(*last_known), "stale": True}
+    return with_elapsed(fetched_at, response)
+
+
+def _serve(room_code, entry):
+    fetched_at, response = entry
+    last_known = cache.get(last_known_key(room_code)) if response.get("Unavailable") else None
+    return serve_now_playing(fetched_at, response, last_known)
+
+
+def get_now_playing(room):
+    """
+    Return the host's currently-playing payload for a room.
+
+    The playback scheduler keeps the cache warm for rooms with listeners, so a
+    request normally never reaches Spotify. On a miss, concurrent pollers wait
+    on the room lock and reuse the single in-flight fetch instead of each
+    calling Spotify. While Spotify is unavailable the last known payload is
+    returned with a staleness marker (see serve_now_playing).
+    """
+    key = cache_key(room.code)
+    cached = cache.get(key)
+    if cached is not None:
+        return _serve(room.code, cached)
+
+    with _room_lock(room.code):
+        # Another poller may have filled the cache while we were waiting.
+        cached = cache.get(key)
+        if cached is None:
+            with span("now playing fetch", room=room.code):
+                response, _ = fetch_now_playing(room)
+            cached = (time.time(), response)
+
+    return _serve(room.code, cached)
+
+
+def _fetch_in_worker(room):
+    try:
+        return get_now_playing(room)
+    finally:
+        connections.close_all()  # Worker threads would otherwise leak their connections
+
+
+def get_many_now_playing(rooms):
+    """
+    Return {room code: currently-playing payload} for many rooms at once.
+
+    Cached payloads come from one cache.get_many(); rooms missing from the
+    cache are fetched in parallel on up to SPOTIFY_BATCH_WORKERS threads, each
+    going through get_now_playing's per-room single flight.
+    """
+    entries = cache.get_many([cache_key(room.code) for room in rooms])
+    payloads = {}
+    missing = []
+    for room in rooms:
+        entry = entries.get(cache_key(room.code))
+        if entry is None:
+            missing.append(room)
+        else:
+            payloads[room.code] = _serve(room.code, entry)
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), settings.SPOTIFY_BATCH_WORKERS)) as pool:
+            for room, payload in zip(missing, pool.map(_fetch_in_worker, missing)):
+                payloads[room.code] = payload
+    return payloads
+
+
+def invalidate_now_playing(room_code):
+    """Drop the cached payload so the next poll sees a play/pause/skip at once."""
+    cache.delete(cache_key(room_code))
+
+
+def update_room_song(room, song_id):
+    """
+    Record a track change on the room and clear the previous song's votes.
+
+    A song that was just skipped by vote is ignored until Spotify reports a
+    different track, and the update is conditional on the stored row so a
+    stale room object can't bring it back either. Votes already cast for the
+    new song (by guests who saw it first) are kept and counted.
+    """
+    if song_id in (room.current_song, room.skipped_song):
+        return
+    skip_votes = Vote.objects.filter(room=room, song_id=song_id).count()
+    updated = Room.objects.filter(pk=room.pk).exclude(skipped_song=song_id).update(
+        current_song=song_id, skip_votes=skip_votes, skipped_song=None, updated_at=timezone.now(),
+    )
+    if updated:
+        room.current_song, room.skip_votes, room.skipped_song = song_id, skip_votes, None
+        Vote.objects.filter(room=room).exclude(song_id=song_id).delete()
+
+
+def get_room_state(room):
+    """Build the now-playing state shown to a room, or None when nothing plays."""
+    return build_room_state(room, get_now_playing(room))
+
+
+def get_many_room_states(rooms):
+    """Return {room code: state or None} for many rooms; see get_many_now_playing."""
+    payloads = get_many_now_playing(rooms)
+    return {room.code: build_room_state(room, payloads[room.code]) for room in rooms}
+
+
+def build_room_state(room, response):
+    """Turn a currently-playing payload into the room's state, or None when nothing plays."""
+    if "error" in response or response.get("item") is None:
+        return None
+
+    song_id = response["item"]["id"]
+    update_room_song(room, song_id)
+    images = sorted(
+        ({"url": image["url"], "width": image.get("width") or 0} for image in response["item"]["album"]["images"]),
+        key=lambda image: image["width"],
+    )
+
+    return {
+        "title": response["item"]["name"],
+        "artist": ", ".join(artist["name"] for artist in response["item"]["artists"]),
+        "album_image": images[-1]["url"] if images else None,  # Largest; views pick by art_size (album_art.for_display)
+        "album_images": images,  # Smallest first
+        "progress_ms": response["progress_ms"],
+        "duration_ms": response["item"]["duration_ms"],
+        "is_playing": response.get("is_playing", False),
+        "server_time": int(time.time() * 1000),  # When progress_ms was read, in ms since the epoch
+        "stale": response.get("stale", False),
+        "votes": room.skip_votes,
+        "votes_required": room.votes_to_skip,
+        "song_id": song_id,
+    }
+
+
+def state_etag(state):
+    """
+    ETag for a room state: it changes with the song, votes, play/pause and
+    seeks, but not as a track simply plays on, so pollers mostly get 304s and
+    advance the progress bar themselves.
+    """
+    if state["is_playing"]:
+        position = round(time.time() - state["progress_ms"] / 1000)  # When the track started
+    else:
+        position = state["progress_ms"]
+    return make_etag(
+        state["song_id"], state["votes"], state["votes_required"], state["is_playing"], state["stale"], position,
+    )
@@ -0,0 +1,113 @@
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from api.models import Room
+from .now_playing import get_room_state
+from .scheduler import scheduler
+
+
+def load_room_state(room_code):
+    """Return the room's state ({} when nothing plays), or None if the room is gone."""
+    try:
+        room = Room.objects.filter(code=room_code).first()
+        if room is None:
+            return None
+        return get_room_state(room) or {}
+    finally:
+        # Runs on a sync_to_async executor thread that no request cycle ever closes.
+        connections.close_all()
+
+
+class RoomChannel:
+    """Event-stream listeners of one room, bound to the event loop serving them."""
+
+    def __init__(self, room_code, loop):
+        self.room_code = room_code
+        self.loop = loop
+        self.subscribers = set()
+        self.state = None
+
+
+class NowPlayingBroadcaster:
+    """
+    Fan out room now-playing state to server-sent-event listeners.
+
+    Listeners register their room with the playback scheduler, which does the
+    only upstream polling; every poll result is handed to the room's channel
+    and copied to each listener. Each listener holds a one-slot queue: a client
+    that falls behind only ever receives the newest state.
+    """
+
+    def __init__(self):
+        self.channels = {}
+        scheduler.subscribe(self.on_update)
+
+    def subscribe(self, room_code):
+        channel = self.channels.get(room_code)
+        if channel is None:
+            channel = self.channels[room_code] = RoomChannel(room_code, asyncio.get_running_loop())
+
+        queue = asyncio.Queue(maxsize=1)
+        channel.subscribers.add(queue)
+        if channel.state is not None:
+            queue.put_nowait(channel.state)
+        scheduler.listen(room_code)
+        return queue
+
+    def unsubscribe(self, room_code, queue):
+        scheduler.unlisten(room_code)
+        channel = self.channels.get(room_code)
+        if channel is None:
+            return
+        channel.subscribers.discard(queue)
+        if not channel.subscribers:
+            del self.channels[room_code]
+
+    def on_update(self, room_code, state):
+        """Scheduler callback; runs on the scheduler thread."""
+        channel = self.channels.get(room_code)
+        if channel is None:
+            return
+        try:
+            channel.loop.call_soon_threadsafe(self.publish, room_code, state)
+        except RuntimeError:
+            pass  # The serving event loop has shut down.
+
+    def publish(self, room_code, state):
+        channel = self.channels.get(room_code)
+        if channel is None:
+            return
+        channel.state = state
+        for queue in channel.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(state)
+
+    async def stream(self, room_code, present=None):
+        """Yield server-sent events for a room until the client disconnects; `present` adapts each state."""
+        queue = self.subscribe(room_code)
+        try:
+            if queue.empty():
+                state = await sync_to_async(load_room_state, thread_sensitive=False)(room_code)
+                if queue.empty():
+                    self.publish(room_code, state)
+
+            while True:
+                try:
+                    state = await asyncio.wait_for(queue.get(), settings.SPOTIFY_PUSH_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Comment lines keep proxies from closing an idle stream.
+                    yield ": keepalive\n\n"
+                    continue
+
+                if state is None:
+                    yield "event: closed\ndata: {}\n\n"
+                    return
+                yield f"data: {json.dumps(present(state) if present else state)}\n\n"
+        finally:
+            self.unsubscribe(room_code, queue)
+
+
+broadcaster = NowPlayingBroadcaster()
@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from api.models import Room
+from .models import Spotify_token
+from .util import refresh_spotify_token, token_needs_refresh
+
+logger = logging.getLogger(__name__)
+
+
+class TokenRefresher:
+    """
+    Renew Spotify tokens shortly before they expire, off the request path.
+
+    Every SPOTIFY_TOKEN_REFRESH_INTERVAL seconds a background thread refreshes
+    the tokens of room hosts that expire within SPOTIFY_TOKEN_REFRESH_MARGIN,
+    so requests find a valid token instead of waiting on accounts.spotify.com
+    themselves. The margin must exceed the interval for this to hold. Tokens of
+    users hosting no room are left to refresh on demand.
+
+    A token whose refresh fails (e.g. a revoked grant) is retried after a delay
+    that doubles with each failure, up to SPOTIFY_TOKEN_REFRESH_MAX_BACKOFF, so
+    it doesn't take accounts.spotify.com rate-limit slots from logins.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._backoff = {}  # session_id -> (failures, monotonic time of the next attempt)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="spotify-token-refresher", daemon=True)
+                self._thread.start()
+
+    def refresh_expiring(self):
+        horizon = timezone.now() + timedelta(seconds=settings.SPOTIFY_TOKEN_REFRESH_MARGIN)
+        expiring = list(
+            Spotify_token.objects.filter(expires_in__lte=horizon)
+            .filter(Exists(Room.objects.filter(host=OuterRef("user"))))
+            .values_list("user", flat=True)
+        )
+        # Forget failures of tokens that were refreshed elsewhere or are gone.
+        self._backoff = {session_id: entry for session_id, entry in self._backoff.items() if session_id in expiring}
+
+        now = time.monotonic()
+        for session_id in expiring:
+            failures, retry_at = self._backoff.get(session_id, (0, 0))
+            if now < retry_at:
+                continue
+            tokens = refresh_spotify_token(session_id)
+            if tokens is None or not token_needs_refresh(tokens):
+                self._backoff.pop(session_id, None)
+                continue
+            delay = min(settings.SPOTIFY_TOKEN_REFRESH_INTERVAL * 2 ** failures, settings.SPOTIFY_TOKEN_REFRESH_MAX_BACKOFF)
+            logger.warning("Token refresh failed, backing off session=%s failures=%s delay=%s", session_id, failures + 1, delay)
+            self._backoff[session_id] = (failures + 1, now + delay)
+
+    def _run(self):
+        while True:
+            close_old_connections()
+            try:
+                self.refresh_expiring()
+            except Exception:
+                logger.exception("Background token refresh failed")
+            finally:
+                close_old_connections()
+            time.sleep(settings.SPOTIFY_TOKEN_REFRESH_INTERVAL)
+
+
+refresher = TokenRefresher()
@@ -0,0 +1,172 @@
+import heapq
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from api.models import Room
+from .cleanup import janitor
+from .now_playing import cache_key, fetch_now_playing, get_room_state, next_poll_delay
+from .refresher import refresher
+from .util import poll_logger
+
+logger = logging.getLogger(__name__)
+
+
+class PlaybackScheduler:
+    """
+    Own the upstream polling of player/currently-playing for active rooms.
+
+    A room is active while it has an open event stream or a client polled it
+    within SPOTIFY_LISTENER_TIMEOUT seconds. One background thread polls each
+    active room with the host's token, stores the payload in the now-playing
+    cache that request handlers read, and picks the next poll time from the
+    playback position (see now_playing.next_poll_delay). Inactive rooms are
+    dropped the next time they come due.
+    """
+
+    def __init__(self):
+        self._wakeup = threading.Condition()
+        self._queue = []  # Heap of (due_at, room_code); stale entries are skipped
+        self._due = {}  # room_code -> due_at of its live heap entry
+        self._last_seen = {}  # room_code -> monotonic time of the last polling client
+        self._listeners = {}  # room_code -> number of open event streams
+        self._subscribers = []  # Callables taking (room_code, state)
+        self._thread = None
+
+    def start(self):
+        if not settings.SPOTIFY_BACKGROUND_TASKS:
+            return
+        # Rooms being polled need their hosts' tokens kept fresh.
+        refresher.start()
+        janitor.start()
+        with self._wakeup:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="spotify-playback-scheduler", daemon=True)
+                self._thread.start()
+
+    def subscribe(self, callback):
+        """Call callback(room_code, state) after every poll; state is None once a room closes."""
+        self._subscribers.append(callback)
+
+    def touch(self, room_code):
+        """
+        Record a polling client for a room, scheduling the room if it was idle.
+
+        The client has just read the room's state, so its first background
+        poll is due when that cached payload is, not straight away.
+        """
+        with self._wakeup:
+            self._last_seen[room_code] = time.monotonic()
+            idle = room_code not in self._due
+        if idle:
+            due_at = self._cached_due_at(room_code)
+            with self._wakeup:
+                self._schedule(room_code, due_at)
+        self.start()
+
+    def _cached_due_at(self, room_code):
+        """Monotonic time the room's cached payload is due for a poll; now if nothing is cached."""
+        entry = cache.get(cache_key(room_code))
+        if entry is None:
+            return time.monotonic()
+        fetched_at, response = entry
+        return time.monotonic() + max(0, fetched_at + next_poll_delay(response) - time.time())
+
+    def listen(self, room_code):
+        """Register an open event stream for a room."""
+        with self._wakeup:
+            self._listeners[room_code] = self._listeners.get(room_code, 0) + 1
+            if room_code not in self._due:
+                self._schedule(room_code, time.monotonic())
+        self.start()
+
+    def unlisten(self, room_code):
+        with self._wakeup:
+            count = self._listeners.get(room_code, 0) - 1
+            if count > 0:
+                self._listeners[room_code] = count
+            else:
+                self._listeners.pop(room_code, None)
+
+    def poke(self, room_code):
+        """Poll a scheduled room now, e.g. right after a play/pause/skip."""
+        with self._wakeup:
+            if room_code in self._due or room_code in self._last_seen or room_code in self._listeners:
+                self._schedule(room_code, time.monotonic())
+
+    def notify(self, room):
+        """Republish a room's state to its event streams without calling Spotify, e.g. after a vote."""
+        if self._subscribers and self._listeners.get(room.code):
+            self._publish(room.code, get_room_state(room) or {})
+
+    def _schedule(self, room_code, due_at):
+        # Keep whichever poll is due first. Caller holds self._wakeup.
+        current = self._due.get(room_code)
+        if current is not None and current <= due_at:
+            return
+        self._due[room_code] = due_at
+        heapq.heappush(self._queue, (due_at, room_code))
+        self._wakeup.notify()
+
+    def _is_active(self, room_code, now):
+        if self._listeners.get(room_code):
+            return True
+        last_seen = self._last_seen.get(room_code)
+        return last_seen is not None and now - last_seen < settings.SPOTIFY_LISTENER_TIMEOUT
+
+    def _next_due_room(self):
+        """Block until a room is due and return its code. Caller holds self._wakeup."""
+        while True:
+            while self._queue and self._due.get(self._queue[0][1]) != self._queue[0][0]:
+                heapq.heappop(self._queue)
+
+            now = time.monotonic()
+            if self._queue and self._queue[0][0] <= now:
+                _, room_code = heapq.heappop(self._queue)
+                del self._due[room_code]
+                if self._is_active(room_code, now):
+                    return room_code
+                self._last_seen.pop(room_code, None)
+                continue
+
+            self._wakeup.wait(self._queue[0][0] - now if self._queue else None)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                room_code = self._next_due_room()
+
+            delay = self._poll(room_code)
+
+            if delay is not None:
+                with self._wakeup:
+                    self._schedule(room_code, time.monotonic() + delay)
+
+    def _poll(self, room_code):
+        """Refresh one room; return seconds until its next poll, or None if it closed."""
+        close_old_connections()
+        try:
+            room = Room.objects.filter(code=room_code).first()
+            if room is None:
+                self._publish(room_code, None)
+                return None
+
+            response, delay = fetch_now_playing(room)
+            poll_logger.debug("Polled room=%s error=%s next_poll=%.1fs", room_code, response.get("Error"), delay)
+            if self._subscribers:
+                self._publish(room_code, get_room_state(room) or {})
+            return delay
+        except Exception:
+            logger.exception("Playback poll failed room=%s", room_code)
+            return settings.SPOTIFY_POLL_IDLE
+        finally:
+            close_old_connections()
+
+    def _publish(self, room_code, state):
+        for callback in self._subscribers:
+            callback(room_code, state)
+
+
+scheduler = PlaybackScheduler()
@@ -0,0 +1,79 @@
+import logging
+import queue
+import threading
+from django.conf import settings
+from django.db import close_old_connections
+from .now_playing import invalidate_now_playing
+from .scheduler import scheduler
+from .util import skip_song
+from .votes import release_skip, reset_skip_votes
+
+logger = logging.getLogger(__name__)
+
+
+class SkipQueue:
+    """
+    Run vote-triggered skips off the request path.
+
+    The vote that reaches a room's threshold submits a "skip this room at this
+    song" job and returns at once; a background thread sends player/next with
+    the host's token, refreshes the room's now-playing state and clears the
+    song's votes. Jobs are keyed by (room_code, song_id), and a key that is
+    already queued or running is dropped, so one song is never skipped twice.
+    With SPOTIFY_BACKGROUND_TASKS off, jobs run inline in the caller.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        self._pending = set()  # (room_code, song_id) queued or running
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="spotify-skip-queue", daemon=True)
+                self._thread.start()
+
+    def submit(self, room, song_id):
+        """Queue a skip of `song_id` in `room`; return False if one is already pending."""
+        key = (room.code, song_id)
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+
+        if not settings.SPOTIFY_BACKGROUND_TASKS:
+            self._execute(key, room)
+            return True
+
+        self._jobs.put((key, room))
+        self.start()
+        return True
+
+    def _run(self):
+        while True:
+            key, room = self._jobs.get()
+            close_old_connections()
+            try:
+                self._execute(key, room)
+            finally:
+                close_old_connections()
+
+    def _execute(self, key, room):
+        try:
+            response = skip_song(room.host)
+            invalidate_now_playing(room.code)
+            reset_skip_votes(room, key[1])
+            if response.get("Unavailable"):
+                logger.warning("Skip failed room=%s song=%s error=%s", *key, response["Error"])
+                release_skip(room, key[1])
+            scheduler.poke(room.code)
+        except Exception:
+            logger.exception("Skip job failed room=%s song=%s", *key)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+
+skip_queue = SkipQueue()
@@ -0,0 +1,194 @@
+import json
+import random
+import socket
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+TRACK = {
+    "id": "stub-track",
+    "name": "Stub Track",
+    "artists": [{"name": "Stub Artist"}],
+    "album": {"images": [
+        {"url": "https://i.scdn.co/image/stub-640", "height": 640, "width": 640},
+        {"url": "https://i.scdn.co/image/stub-300", "height": 300, "width": 300},
+        {"url": "https://i.scdn.co/image/stub-64", "height": 64, "width": 64},
+    ]},
+    "duration_ms": 180000,
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections open between requests
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this, Nagle's
+        # algorithm stalls every keep-alive response on the client's delayed ACK.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.stub.record_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload=None, headers=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        stub = self.server.stub
+        path = self.path.split("?", 1)[0]
+        stub.record_call(self.command, path)
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        injected = stub.take_injected(path) or stub.random_failure()
+        if injected is not None:
+            status, headers = injected
+            self._reply(status, {"error": {"status": status, "message": "Injected by stub"}}, headers)
+            return
+
+        route = (self.command, path)
+        if route == ("POST", "/api/token"):
+            self._reply(200, {
+                "access_token": "stub-access-token",
+                "token_type": "Bearer",
+                "expires_in": 3600,
+                "refresh_token": "stub-refresh-token",
+            })
+        elif route == ("GET", "/v1/me/player/currently-playing"):
+            self._reply(200, stub.playback())
+        elif route == ("GET", "/v1/me/"):
+            self._reply(200, {"product": "premium"})
+        elif route in (("PUT", "/v1/me/player/play"), ("PUT", "/v1/me/player/pause"), ("POST", "/v1/me/player/next")):
+            self._reply(204)
+        elif self.command == "GET" and path.startswith("/image/"):
+            body = b"\xff\xd8\xff\xe0" + path.encode()  # A JPEG header and the id, enough to tell images apart
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._reply(404, {"error": {"status": 404, "message": "Not found"}})
+
+    do_GET = do_PUT = do_POST = _handle
+
+
+class StubSpotify:
+    """
+    Local stand-in for api.spotify.com and accounts.spotify.com.
+
+    Serves the handful of endpoints this project calls over plain HTTP with
+    keep-alive, adding `latency` seconds to every response, and counts the
+    calls and TCP connections it receives. fail_next() makes upcoming calls
+    answer with an error status instead, e.g. a 401 or a 429 with Retry-After.
+    For load tests, `error_rate` and `rate_limit_rate` make that share of all
+    calls fail at random with a 503, or a 429 asking to retry after
+    `retry_after` seconds. Point SPOTIFY_API_URL at `api_url`,
+    SPOTIFY_ACCOUNTS_URL at `accounts_url` and ALBUM_ART_URL at `image_url` to
+    use it.
+    """
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.connections = 0
+        self._injected = []
+        self._lock = Lock()
+        self._started_at = time.time()
+        self._server = ThreadingHTTPServer((host, port), StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def api_url(self):
+        return self.url + "v1/"
+
+    @property
+    def accounts_url(self):
+        return self.url
+
+    @property
+    def image_url(self):
+        return self.url + "image/"
+
+    def start(self):
+        self._thread = Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, name="spotify-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def record_call(self, method, path):
+        with self._lock:
+            self.calls[f"{method} {path}"] += 1
+
+    def fail_next(self, status, times=1, path=None, headers=None):
+        """Answer the next `times` calls (to `path`, if given) with `status`."""
+        with self._lock:
+            self._injected.extend([(path, status, headers or {})] * times)
+
+    def take_injected(self, path):
+        with self._lock:
+            for index, (match, status, headers) in enumerate(self._injected):
+                if match is None or match == path:
+                    del self._injected[index]
+                    return status, headers
+        return None
+
+    def random_failure(self):
+        """Pick a random (status, headers) failure per error_rate and rate_limit_rate, or None."""
+        roll = random.random()
+        if roll < self.error_rate:
+            return 503, {}
+        if roll < self.error_rate + self.rate_limit_rate:
+            return 429, {"Retry-After": str(self.retry_after)}
+        return None
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls.clear()
+            self.connections = 0
+
+    def playback(self):
+        """A track that loops forever, with progress following the wall clock."""
+        elapsed_ms = int((time.time() - self._started_at) * 1000)
+        return {
+            "item": TRACK,
+            "progress_ms": elapsed_ms % TRACK["duration_ms"],
+            "is_playing": True,
+        }
@@ -1,3 +1,747 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import skipUnless
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from api.models import Room
+from . import client as client_module, util
+from .cleanup import run_cleanup
+from .models import Spotify_token, Vote
+from .now_playing import (
+    cache_key, get_now_playing, get_room_state, next_poll_delay, store_now_playing, update_room_song,
+)
+from .push import NowPlayingBroadcaster
+from .refresher import TokenRefresher
+from .scheduler import PlaybackScheduler, scheduler
+from .skips import skip_queue
+from .stub import StubSpotify
+from .votes import ALREADY_VOTED, SKIP, VOTED, cast_skip_vote
 
-# Create your tests here.
+
+def token_queries(context):
+    return [q for q in context.captured_queries if "spotify_spotify_token" in q["sql"]]
+
+
+class SpotifyStubMixin:
+    """
+    Run each test against its own StubSpotify, with the token and now-playing
+    caches and the per-host rate limiters and circuit breakers emptied.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for state in (util._token_cache, cache, client_module._buckets, client_module._breakers):
+            state.clear()
+            self.addCleanup(state.clear)
+        self.stub = StubSpotify().start()
+        self.addCleanup(self.stub.stop)
+        overrides = override_settings(SPOTIFY_API_URL=self.stub.api_url, SPOTIFY_ACCOUNTS_URL=self.stub.accounts_url)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def make_token(self, user="host", expires_in=timedelta(hours=1)):
+        return Spotify_token.objects.create(
+            user=user,
+            access_token="access",
+            refresh_token="refresh",
+            token_type="Bearer",
+            expires_in=timezone.now() + expires_in,
+        )
+
+    def enter_room(self, code, client=None):
+        """Put this test's client (or `client`) in a room, as joining it would."""
+        session = (client or self.client).session
+        session["room_code"] = code
+        session.save()
+
+
+@override_settings(SPOTIFY_BACKGROUND_TASKS=False)
+class SpotifyStubTestCase(SpotifyStubMixin, TestCase):
+    pass
+
+
+class TokenCacheTests(SpotifyStubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_token()
+
+    def test_lookup_is_cached_after_first_query(self):
+        with self.assertNumQueries(1):
+            util.get_user_tokens("host")
+        with self.assertNumQueries(0):
+            self.assertEqual(util.get_user_tokens("host").access_token, "access")
+            self.assertTrue(util.is_spotify_authenticated("host"))
+
+    def test_update_writes_through(self):
+        util.update_or_create_user_tokens("host", "new-access", "Bearer", 3600, "refresh")
+        with self.assertNumQueries(0):
+            self.assertEqual(util.get_user_tokens("host").access_token, "new-access")
+
+    def test_token_due_for_refresh_is_reloaded(self):
+        util.get_user_tokens("host")
+        Spotify_token.objects.filter(user="host").update(access_token="rotated")
+        util._token_cache["host"].expires_in = timezone.now()
+        with self.assertNumQueries(1):
+            self.assertEqual(util.get_user_tokens("host").access_token, "rotated")
+
+    def test_current_song_makes_no_token_queries_when_warm(self):
+        Room.objects.create(code="ROOMCODE", host="host")
+        self.enter_room("ROOMCODE")
+
+        self.client.get("/spotify/current-song")
+        util.execute_spotify_api_request("host", "player/currently-playing")
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/spotify/current-song")
+            util.execute_spotify_api_request("host", "player/currently-playing")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(token_queries(context), [])
+
+
+class TokenRefresherTests(SpotifyStubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.refresher = TokenRefresher()
+        self.make_token("host", expires_in=timedelta(seconds=30))
+        Room.objects.create(code="ROOMCODE", host="host")
+
+    def test_sweep_skips_users_hosting_no_room(self):
+        self.make_token("left", expires_in=timedelta(seconds=30))
+        self.refresher.refresh_expiring()
+
+        self.assertEqual(self.stub.calls["POST /api/token"], 1)
+        self.assertEqual(util.get_user_tokens("host").access_token, "stub-access-token")
+        self.assertEqual(util.get_user_tokens("left").access_token, "access")
+
+    def test_failed_refresh_is_backed_off(self):
+        self.stub.fail_next(400, path="/api/token")
+        self.refresher.refresh_expiring()
+        self.refresher.refresh_expiring()
+        self.assertEqual(self.stub.calls["POST /api/token"], 1)
+
+        self.refresher._backoff["host"] = (1, 0)  # Backoff elapsed
+        self.refresher.refresh_expiring()
+        self.assertEqual(self.stub.calls["POST /api/token"], 2)
+        self.assertEqual(self.refresher._backoff, {})
+
+
+@override_settings(SPOTIFY_BACKGROUND_TASKS=False)
+class TokenRefreshConcurrencyTests(SpotifyStubMixin, TransactionTestCase):
+    def test_concurrent_refreshes_call_spotify_once(self):
+        self.make_token("host", expires_in=timedelta(seconds=30))
+        self.stub.latency = 0.1  # Keep the first refresh in flight while the others arrive
+        barrier = threading.Barrier(5)
+        results = []
+
+        def refresh():
+            barrier.wait()
+            try:
+                results.append(util.refresh_spotify_token("host").access_token)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=refresh) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["stub-access-token"] * 5)
+        self.assertEqual(self.stub.calls["POST /api/token"], 1)
+
+    def test_refresh_held_by_another_process_is_awaited(self):
+        self.make_token("host", expires_in=timedelta(seconds=30))
+        cache.add(util.refresh_lock_key("host"), "other-process")
+
+        def other_process_refreshes():
+            try:
+                Spotify_token.objects.filter(user="host").update(
+                    access_token="other-access", expires_in=timezone.now() + timedelta(hours=1),
+                )
+                cache.delete(util.refresh_lock_key("host"))
+            finally:
+                connections.close_all()
+
+        timer = threading.Timer(0.2, other_process_refreshes)
+        timer.start()
+        tokens = util.refresh_spotify_token("host")
+        timer.join()
+
+        self.assertEqual(tokens.access_token, "other-access")
+        self.assertEqual(self.stub.calls["POST /api/token"], 0)
+
+
+@override_settings(SPOTIFY_BACKGROUND_TASKS=False)
+class NowPlayingConcurrencyTests(SpotifyStubMixin, TransactionTestCase):
+    def test_concurrent_pollers_share_one_fetch(self):
+        self.make_token()
+        Room.objects.create(code="ROOMCODE", host="host", current_song="stub-track")
+        self.stub.latency = 0.1  # Keep the first fetch in flight while the others arrive
+        barrier = threading.Barrier(20)
+        results = []
+
+        def poll():
+            room = Room.objects.get(code="ROOMCODE")
+            barrier.wait()
+            try:
+                results.append(get_now_playing(room)["item"]["id"])
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=poll) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["stub-track"] * 20)
+        self.assertEqual(self.stub.calls["GET /v1/me/player/currently-playing"], 1)
+
+
+class RetryTests(SpotifyStubTestCase):
+    endpoint = "player/currently-playing"
+    path = "/v1/me/player/currently-playing"
+
+    def setUp(self):
+        super().setUp()
+        self.make_token()
+
+    def test_401_refreshes_and_retries_once(self):
+        self.stub.fail_next(401, path=self.path)
+        response = util.execute_spotify_api_request("host", self.endpoint)
+
+        self.assertNotIn("Error", response)
+        self.assertEqual(self.stub.calls[f"GET {self.path}"], 2)
+        self.assertEqual(self.stub.calls["POST /api/token"], 1)
+        self.assertEqual(util.get_user_tokens("host").access_token, "stub-access-token")
+
+    def test_repeated_401_is_not_retried_again(self):
+        self.stub.fail_next(401, times=2, path=self.path)
+        response = util.execute_spotify_api_request("host", self.endpoint)
+
+        self.assertIn("Error", response)
+        self.assertEqual(self.stub.calls[f"GET {self.path}"], 2)
+
+    def test_short_retry_after_is_waited_out(self):
+        self.stub.fail_next(429, path=self.path, headers={"Retry-After": "0"})
+        response = util.execute_spotify_api_request("host", self.endpoint)
+
+        self.assertNotIn("Error", response)
+        self.assertEqual(self.stub.calls[f"GET {self.path}"], 2)
+
+    @override_settings(SPOTIFY_RATE_LIMIT={"default": None})
+    def test_short_retry_after_is_slept_without_a_rate_limiter(self):
+        self.stub.fail_next(429, path=self.path, headers={"Retry-After": "1"})
+        started = time.monotonic()
+        response = util.execute_spotify_api_request("host", self.endpoint)
+
+        self.assertNotIn("Error", response)
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+        self.assertEqual(self.stub.calls[f"GET {self.path}"], 2)
+
+    def test_long_retry_after_fails_fast(self):
+        self.stub.fail_next(429, path=self.path, headers={"Retry-After": "30"})
+        with override_settings(SPOTIFY_RATE_LIMIT={"default": (100, 100)}):
+            response = util.execute_spotify_api_request("host", self.endpoint)
+            blocked = util.execute_spotify_api_request("host", self.endpoint)
+
+        self.assertIn("429", response["Error"])
+        self.assertIn("Rate limit", blocked["Error"])
+        self.assertEqual(self.stub.calls[f"GET {self.path}"], 1)
+
+
+@override_settings(SPOTIFY_CIRCUIT_FAILURES=2, SPOTIFY_NOW_PLAYING_TTL=0)
+class OutageTests(SpotifyStubTestCase):
+    path = "/v1/me/player/currently-playing"
+
+    def setUp(self):
+        super().setUp()
+        self.make_token()
+        self.room = Room.objects.create(code="ROOMCODE", host="host")
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        self.stub.fail_next(503, times=2)
+        for _ in range(3):
+            response = util.execute_spotify_api_request("host", "player/currently-playing")
+
+        self.assertTrue(response["Unavailable"])
+        self.assertIn("Circuit breaker", response["Error"])
+        self.assertEqual(self.stub.calls[f"GET {self.path}"], 2)
+
+    @override_settings(SPOTIFY_CIRCUIT_RESET=0, SPOTIFY_RATE_LIMIT={"default": (1, 1)})
+    def test_trial_call_without_outcome_frees_the_half_open_circuit(self):
+        self.stub.fail_next(503, times=2)
+        for _ in range(2):
+            util.execute_spotify_api_request("host", "player/currently-playing")
+        self.assertTrue(client_module.circuit_breaker("127.0.0.1").is_open)
+
+        bucket = client_module.rate_limiter("127.0.0.1")
+        bucket.pause(60)
+        refused = util.execute_spotify_api_request("host", "player/currently-playing")
+        self.assertIn("Rate limit", refused["Error"])
+
+        bucket.paused_until, bucket.tokens = 0, 1
+        response = util.execute_spotify_api_request("host", "player/currently-playing")
+        self.assertEqual(response["item"]["id"], "stub-track")
+        self.assertFalse(client_module.circuit_breaker("127.0.0.1").is_open)
+
+    def test_current_song_serves_last_known_state_while_unavailable(self):
+        fresh = get_room_state(self.room)
+        self.assertFalse(fresh["stale"])
+
+        cache.delete(cache_key(self.room.code))
+        self.stub.fail_next(503)
+        stale = get_room_state(self.room)
+
+        self.assertTrue(stale["stale"])
+        self.assertEqual(stale["song_id"], fresh["song_id"])
+
+
+class SkipVoteTests(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(code="ROOMCODE", host="host", votes_to_skip=2, current_song="song")
+
+    def vote(self, user):
+        # Each request loads its own copy of the room.
+        return cast_skip_vote(Room.objects.get(pk=self.room.pk), user)
+
+    def test_threshold_skips_exactly_once(self):
+        self.assertEqual(self.vote("guest-1"), VOTED)
+        self.assertEqual(self.vote("guest-2"), SKIP)
+
+        self.room.refresh_from_db()
+        self.assertIsNone(self.room.current_song)
+        self.assertEqual(self.room.skip_votes, 0)
+
+    def test_stale_room_cannot_skip_twice(self):
+        first, second = Room.objects.get(pk=self.room.pk), Room.objects.get(pk=self.room.pk)
+        self.vote("guest-1")
+
+        self.assertEqual(cast_skip_vote(first, "guest-2"), SKIP)
+        self.assertEqual(cast_skip_vote(second, "guest-3"), VOTED)
+
+    def test_repeat_vote_is_rejected(self):
+        self.vote("guest-1")
+        self.assertEqual(self.vote("guest-1"), ALREADY_VOTED)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.skip_votes, 1)
+
+    def test_guest_can_vote_in_several_rooms(self):
+        other = Room.objects.create(code="OTHERRM", host="other-host", current_song="song")
+        self.vote("guest-1")
+        self.assertEqual(cast_skip_vote(other, "guest-1"), SKIP)
+        self.assertEqual(Vote.objects.filter(user="guest-1").count(), 2)
+
+    def test_vote_costs_constant_queries(self):
+        room = Room.objects.get(pk=self.room.pk)
+        # Savepoint, insert, increment, claim, release.
+        with self.assertNumQueries(5):
+            cast_skip_vote(room, "guest-1")
+
+
+class SkipQueueTests(SpotifyStubTestCase):
+    path = "/v1/me/player/next"
+
+    def setUp(self):
+        super().setUp()
+        self.make_token()
+        self.room = Room.objects.create(code="ROOMCODE", host="host", current_song="song")
+
+    def test_skip_runs_once_and_clears_votes(self):
+        Vote.objects.create(user="guest", room=self.room, song_id="song")
+        self.assertTrue(skip_queue.submit(self.room, "song"))
+
+        self.assertEqual(self.stub.calls[f"POST {self.path}"], 1)
+        self.assertFalse(Vote.objects.filter(room=self.room).exists())
+
+    def test_votes_for_the_next_song_survive_the_skip(self):
+        Vote.objects.create(user="guest", room=self.room, song_id="song")
+        Vote.objects.create(user="guest", room=self.room, song_id="next-song")
+        skip_queue.submit(self.room, "song")
+
+        self.assertEqual(list(Vote.objects.values_list("song_id", flat=True)), ["next-song"])
+
+    def test_skipped_song_still_reported_is_not_skipped_again(self):
+        # The stub keeps reporting the skipped track, like a poll racing player/next.
+        Room.objects.filter(pk=self.room.pk).update(current_song="stub-track", votes_to_skip=1)
+        guest = self.client_class()
+        self.enter_room("ROOMCODE")
+        self.enter_room("ROOMCODE", client=guest)
+        self.client.get("/spotify/current-song")
+
+        self.assertEqual(self.client.post("/spotify/skip-song").status_code, 204)
+        get_room_state(Room.objects.get(pk=self.room.pk))
+        self.assertEqual(guest.post("/spotify/skip-song").status_code, 400)
+
+        self.assertEqual(self.stub.calls[f"POST {self.path}"], 1)
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.current_song, self.room.skipped_song), (None, "stub-track"))
+
+    def test_next_track_clears_the_skipped_song(self):
+        Vote.objects.create(user="guest", room=self.room, song_id="next-song")
+        Room.objects.filter(pk=self.room.pk).update(current_song=None, skipped_song="song")
+        room = Room.objects.get(pk=self.room.pk)
+
+        update_room_song(room, "song")
+        self.assertIsNone(room.current_song)
+        update_room_song(room, "next-song")
+
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.current_song, self.room.skipped_song, self.room.skip_votes), ("next-song", None, 1))
+
+    def test_pending_skip_is_not_queued_again(self):
+        skip_queue._pending.add(("ROOMCODE", "song"))
+        self.addCleanup(skip_queue._pending.clear)
+
+        self.assertFalse(skip_queue.submit(self.room, "song"))
+        self.assertEqual(self.stub.calls[f"POST {self.path}"], 0)
+
+
+class ConditionalGetTests(SpotifyStubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_token()
+        self.room = Room.objects.create(code="ROOMCODE", host="host", votes_to_skip=2)
+        self.enter_room("ROOMCODE")
+
+    def test_current_song_is_not_modified_until_votes_change(self):
+        etag = self.client.get("/spotify/current-song")["ETag"]
+        self.assertEqual(self.client.get("/spotify/current-song", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        cast_skip_vote(Room.objects.get(pk=self.room.pk), "guest")
+        self.assertEqual(self.client.get("/spotify/current-song", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_get_room_is_not_modified_until_settings_change(self):
+        etag = self.client.get("/api/get-room", {"code": "ROOMCODE"})["ETag"]
+        response = self.client.get("/api/get-room", {"code": "ROOMCODE"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.room.votes_to_skip = 3
+        self.room.save()
+        response = self.client.get("/api/get-room", {"code": "ROOMCODE"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class NowPlayingBatchTests(SpotifyStubTestCase):
+    def setUp(self):
+        super().setUp()
+        for index in range(3):
+            self.make_token(f"host-{index}")
+            Room.objects.create(code=f"ROOM{index}", host=f"host-{index}")
+            # Worker threads use their own connections, which cannot see this test's rows.
+            util.get_user_tokens(f"host-{index}")
+
+    def test_returns_known_rooms_without_a_session(self):
+        get_room_state(Room.objects.get(code="ROOM0"))
+
+        response = self.client.get("/spotify/now-playing", {"rooms": "ROOM0,ROOM1,ROOM2,NOROOM"})
+
+        rooms = response.json()["rooms"]
+        self.assertEqual(sorted(rooms), ["ROOM0", "ROOM1", "ROOM2"])
+        self.assertEqual(rooms["ROOM1"]["song_id"], "stub-track")
+        self.assertEqual(self.stub.calls["GET /v1/me/player/currently-playing"], 3)
+
+    def test_cached_rooms_cost_one_query(self):
+        for index in range(3):
+            get_room_state(Room.objects.get(code=f"ROOM{index}"))
+
+        with self.assertNumQueries(1):
+            self.client.get("/spotify/now-playing", {"rooms": "ROOM0,ROOM1,ROOM2"})
+
+
+@override_settings(METRICS_TOKEN="metrics-secret")
+class MetricsTests(SpotifyStubTestCase):
+    def test_requests_and_spotify_calls_are_exported(self):
+        self.make_token()
+        util.execute_spotify_api_request("host", "player/currently-playing")
+        self.client.get("/api/room")
+
+        body = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer metrics-secret").content.decode()
+
+        self.assertIn('http_responses_total{view="api/room",method="GET",status="200"}', body)
+        self.assertIn('spotify_responses_total{host="127.0.0.1",path="/v1/me/player/currently-playing",status="200"}', body)
+        self.assertIn('http_request_db_queries_bucket{view="api/room",le="+Inf"}', body)
+
+    def test_scrapes_need_the_token(self):
+        # A same-host proxy makes every client look like 127.0.0.1.
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="127.0.0.1").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(TRACE_TOKEN="trace-secret")
+class TracingTests(SpotifyStubTestCase):
+    auth = {"HTTP_AUTHORIZATION": "Bearer trace-secret"}
+
+    def setUp(self):
+        super().setUp()
+        self.make_token()
+        Room.objects.create(code="ROOMCODE", host="host")
+        self.enter_room("ROOMCODE")
+
+    def span_names(self, span):
+        yield span["name"]
+        for child in span.get("children", []):
+            yield from self.span_names(child)
+
+    def test_traced_request_records_nested_spans(self):
+        response = self.client.get("/spotify/current-song", HTTP_X_TRACE="1", **self.auth)
+
+        traces = self.client.get("/debug/traces", {"id": response["X-Trace-Id"]}, **self.auth).json()["traces"]
+        names = set(self.span_names(traces[0]["root"]))
+        self.assertTrue({"room lookup", "room state", "now playing fetch", "token lookup", "spotify", "db"} <= names)
+
+    def test_untraced_request_has_no_trace(self):
+        response = self.client.get("/spotify/current-song")
+        self.assertFalse(response.has_header("X-Trace-Id"))
+
+    def test_trace_header_and_traces_need_the_token(self):
+        # A same-host proxy makes every client look like 127.0.0.1.
+        response = self.client.get("/spotify/current-song", HTTP_X_TRACE="1", REMOTE_ADDR="127.0.0.1")
+        self.assertFalse(response.has_header("X-Trace-Id"))
+        response = self.client.get("/debug/traces", REMOTE_ADDR="127.0.0.1", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(SPOTIFY_BACKGROUND_TASKS=False)
+class CleanupTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.live = Session.objects.create(session_key="live", session_data="", expire_date=self.now + timedelta(days=1))
+        Session.objects.create(session_key="expired", session_data="", expire_date=self.now - timedelta(days=1))
+        for user in ("live", "expired"):
+            Spotify_token.objects.create(
+                user=user,
+                access_token="access",
+                refresh_token="refresh",
+                token_type="Bearer",
+                expires_in=self.now + timedelta(hours=1),
+            )
+        self.kept = Room.objects.create(code="KEPTROOM", host="live", current_song="new")
+        self.abandoned = Room.objects.create(code="GONEROOM", host="expired")
+        Room.objects.filter(pk__in=[self.kept.pk, self.abandoned.pk]).update(updated_at=self.now - timedelta(days=2))
+
+        yesterday = self.now.date() - timedelta(days=1)
+        Vote.objects.create(room=self.kept, user="guest", song_id="old")
+        Vote.objects.create(room=self.kept, user="guest", song_id="new")
+        Vote.objects.create(room=self.abandoned, user="guest", song_id="old")
+        Vote.objects.update(created_at=yesterday)
+
+    def test_dry_run_counts_without_deleting(self):
+        counts = run_cleanup(dry_run=True)
+
+        self.assertEqual(counts, {"sessions": 1, "rooms": 1, "votes": 2, "tokens": 0})
+        self.assertEqual(Room.objects.count(), 2)
+
+    def test_stale_rows_are_deleted_in_batches(self):
+        counts = run_cleanup(batch_size=1, pause=0)
+
+        self.assertEqual(counts, {"sessions": 1, "rooms": 1, "votes": 1, "tokens": 1})
+        self.assertEqual(list(Room.objects.values_list("code", flat=True)), ["KEPTROOM"])
+        self.assertEqual(list(Vote.objects.values_list("song_id", flat=True)), ["new"])
+        self.assertEqual(list(Spotify_token.objects.values_list("user", flat=True)), ["live"])
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["live"])
+
+
+class AlbumArtTests(SpotifyStubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_token()
+        Room.objects.create(code="ROOMCODE", host="host")
+        self.enter_room("ROOMCODE")
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        overrides = override_settings(ALBUM_ART_CACHE_DIR=cache_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_image_is_picked_by_display_size(self):
+        def album_image(**params):
+            return self.client.get("/spotify/current-song", params).json()["album_image"]
+
+        self.assertEqual(album_image(art_size=200), "https://i.scdn.co/image/stub-300")
+        self.assertEqual(album_image(art_size=48), "https://i.scdn.co/image/stub-64")
+        self.assertEqual(album_image(art_size=2000), "https://i.scdn.co/image/stub-640")
+        self.assertEqual(album_image(), "https://i.scdn.co/image/stub-640")
+
+    @override_settings(ALBUM_ART_PROXY=True)
+    def test_proxied_images_are_fetched_once(self):
+        song = self.client.get("/spotify/current-song", {"art_size": 200}).json()
+        self.assertEqual(song["album_image"], "/spotify/album-art/stub-300")
+
+        with override_settings(ALBUM_ART_URL=self.stub.image_url):
+            first = self.client.get(song["album_image"])
+            second = self.client.get(song["album_image"])
+
+        self.assertEqual(b"".join(second.streaming_content), b"".join(first.streaming_content))
+        self.assertEqual(second["Content-Type"], "image/jpeg")
+        self.assertIn("immutable", second["Cache-Control"])
+        self.assertEqual(self.stub.calls["GET /image/stub-300"], 1)
+
+        with override_settings(METRICS_TOKEN="metrics-secret"):
+            metrics = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer metrics-secret").content.decode()
+        self.assertIn('path="/image/:id"', metrics)
+        self.assertNotIn("stub-300", metrics)
+
+    @override_settings(ALBUM_ART_PROXY=True, ALBUM_ART_CACHE_MAX_BYTES=45)  # Room for two of the stub's images
+    def test_least_recently_served_images_are_evicted(self):
+        with override_settings(ALBUM_ART_URL=self.stub.image_url):
+            for image_id in ("stub-640", "stub-300", "stub-640", "stub-64"):
+                self.client.get(f"/spotify/album-art/{image_id}")
+
+        self.assertEqual(sorted(os.listdir(settings.ALBUM_ART_CACHE_DIR)), ["stub-64", "stub-640"])
+
+    def test_proxy_is_off_by_default(self):
+        self.assertEqual(self.client.get("/spotify/album-art/stub-300").status_code, 404)
+
+
+class NextPollDelayTests(SimpleTestCase):
+    def playing(self, progress_ms, is_playing=True):
+        return {"is_playing": is_playing, "progress_ms": progress_ms, "item": {"duration_ms": 180000}}
+
+    def test_poll_lands_just_after_the_track_ends(self):
+        self.assertEqual(next_poll_delay(self.playing(177000)), 3.5)
+
+    def test_delay_is_clamped(self):
+        self.assertEqual(next_poll_delay(self.playing(0)), settings.SPOTIFY_POLL_MAX)
+        self.assertEqual(next_poll_delay(self.playing(180000)), settings.SPOTIFY_POLL_MIN)
+
+    def test_paused_and_idle_rooms_use_their_intervals(self):
+        self.assertEqual(next_poll_delay(self.playing(1000, is_playing=False)), settings.SPOTIFY_POLL_PAUSED)
+        self.assertEqual(next_poll_delay({"item": None}), settings.SPOTIFY_POLL_IDLE)
+        self.assertEqual(next_poll_delay({"Error": "Spotify unavailable"}), settings.SPOTIFY_POLL_IDLE)
+
+
+class PlaybackSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = PlaybackScheduler()
+
+    def test_earliest_due_time_is_kept(self):
+        with self.scheduler._wakeup:
+            self.scheduler._schedule("ROOM", 10)
+            self.scheduler._schedule("ROOM", 20)
+            self.assertEqual(self.scheduler._due["ROOM"], 10)
+            self.scheduler._schedule("ROOM", 5)
+            self.assertEqual(self.scheduler._due["ROOM"], 5)
+
+    def test_inactive_rooms_are_dropped_when_due(self):
+        now = time.monotonic()
+        self.scheduler._last_seen["IDLE"] = now - settings.SPOTIFY_LISTENER_TIMEOUT - 1
+        self.scheduler._last_seen["POLLED"] = now
+        with self.scheduler._wakeup:
+            self.scheduler._schedule("IDLE", now - 2)
+            self.scheduler._schedule("POLLED", now - 1)
+
+            self.assertEqual(self.scheduler._next_due_room(), "POLLED")
+        self.assertNotIn("IDLE", self.scheduler._last_seen)
+        self.assertEqual(self.scheduler._due, {})
+
+    def test_rooms_with_open_streams_stay_active(self):
+        self.scheduler._listeners["STREAMED"] = 1
+        with self.scheduler._wakeup:
+            self.scheduler._schedule("STREAMED", time.monotonic() - 1)
+            self.assertEqual(self.scheduler._next_due_room(), "STREAMED")
+
+    @override_settings(SPOTIFY_BACKGROUND_TASKS=False)
+    def test_first_poll_is_due_with_the_cached_payload(self):
+        self.addCleanup(cache.clear)
+        delay = store_now_playing("ROOM", {"is_playing": True, "progress_ms": 170000, "item": {"duration_ms": 180000}})
+        self.scheduler.touch("ROOM")
+        self.assertAlmostEqual(self.scheduler._due["ROOM"], time.monotonic() + delay, delta=1)
+
+        self.scheduler.touch("UNCACHED")
+        self.assertLessEqual(self.scheduler._due["UNCACHED"], time.monotonic())
+
+    def test_notify_skips_rooms_without_streams(self):
+        published = []
+        self.scheduler.subscribe(lambda room_code, state: published.append(room_code))
+        self.scheduler.notify(Room(code="ROOM"))
+        self.assertEqual(published, [])
+
+
+try:
+    from .async_views import AsyncCurrentSong, AsyncSkipSong
+except ImportError:  # httpx is optional
+    AsyncCurrentSong = AsyncSkipSong = None
+    urlpatterns = []
+else:
+    # Routes the async playback views in place of the DRF ones, as SPOTIFY_ASYNC_VIEWS does.
+    urlpatterns = [
+        path("spotify/current-song", AsyncCurrentSong.as_view()),
+        path("spotify/skip-song", AsyncSkipSong.as_view()),
+    ]
+
+
+@skipUnless(AsyncCurrentSong, "The async views need httpx")
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewTests(SpotifyStubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_token()
+        Room.objects.create(code="ROOMCODE", host="host", current_song="stub-track")
+        self.enter_room("ROOMCODE", self.async_client)
+
+    async def test_current_song_is_fetched_once_and_then_not_modified(self):
+        response = await self.async_client.get("/spotify/current-song")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["song_id"], "stub-track")
+
+        response = await self.async_client.get("/spotify/current-song", headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.stub.calls["GET /v1/me/player/currently-playing"], 1)
+
+    async def test_deciding_skip_vote_skips_the_song(self):
+        response = await self.async_client.post("/spotify/skip-song")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.stub.calls["POST /v1/me/player/next"], 1)
+
+        response = await self.async_client.post("/spotify/skip-song")
+        self.assertEqual(response.status_code, 400)  # The vote cleared current_song
+
+
+@override_settings(SPOTIFY_BACKGROUND_TASKS=False)
+class NowPlayingBroadcasterTests(SimpleTestCase):
+    async def test_listener_that_falls_behind_gets_only_the_newest_state(self):
+        broadcaster = NowPlayingBroadcaster()
+        self.addCleanup(scheduler._subscribers.remove, broadcaster.on_update)
+        queue = broadcaster.subscribe("ROOMCODE")
+        self.addCleanup(broadcaster.unsubscribe, "ROOMCODE", queue)
+
+        broadcaster.publish("ROOMCODE", {"song_id": "first"})
+        broadcaster.publish("ROOMCODE", {"song_id": "second"})
+
+        self.assertEqual(queue.qsize(), 1)
+        self.assertEqual(await queue.get(), {"song_id": "second"})
+
+
+@override_settings(SPOTIFY_BACKGROUND_TASKS=False)
+class NowPlayingEventsTests(SpotifyStubMixin, TransactionTestCase):
+    # The stream loads state on an executor thread, which only sees committed rows.
+
+    async def test_stream_opens_with_the_current_state(self):
+        await sync_to_async(self.make_token)()
+        await Room.objects.acreate(code="ROOMCODE", host="host")
+        await sync_to_async(self.enter_room)("ROOMCODE", self.async_client)
+
+        response = await self.async_client.get("/spotify/events")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = response.streaming_content
+        try:
+            frame = (await anext(events)).decode()
+        finally:
+            await events.aclose()
+
+        self.assertTrue(frame.startswith("data: "))
+        self.assertEqual(json.loads(frame[len("data: "):])["song_id"], "stub-track")
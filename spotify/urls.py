@@ -1,11 +1,19 @@
+from django.conf import settings
 from django.urls import path
-from .views import AuthURL, spotify_callback, IsAuthenticated, CurrentSong,PauseSong,PlaySong,SkipSong
+from .views import AuthURL, spotify_callback, IsAuthenticated, CurrentSong,PauseSong,PlaySong,SkipSong,NowPlayingBatch,now_playing_events,album_art
+
+if settings.SPOTIFY_ASYNC_VIEWS:
+    # Needs httpx and an ASGI server; see spotify/async_views.py.
+    from .async_views import AsyncCurrentSong as CurrentSong, AsyncPauseSong as PauseSong, AsyncPlaySong as PlaySong, AsyncSkipSong as SkipSong
 
 urlpatterns = [
     path('get-auth-url', AuthURL.as_view()),
     path('redirect', spotify_callback),
     path('is_authenticated', IsAuthenticated.as_view()),
     path('current-song', CurrentSong.as_view()),
+    path('now-playing', NowPlayingBatch.as_view()),
+    path('events', now_playing_events),
+    path('album-art/<slug:image_id>', album_art),
     path('play-song',PlaySong.as_view()),
     path('pause-song',PauseSong.as_view()),
     path('skip-song',SkipSong.as_view())
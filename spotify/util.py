@@ -1,53 +1,87 @@
 from .models import Spotify_token
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+from contextlib import contextmanager
 from datetime import timedelta
+from .client import client, rate_limiter, retry_after_seconds
 from .credentials import CLIENT_ID, CLIENT_SECRET
-from requests import post, put, get
+from .locks import StripedLocks
+import logging
 import requests
+import time
+import uuid
+from urllib.parse import urlsplit
+from music_controller.metrics import spotify_retries, spotify_token_refreshes
+from music_controller.tracing import span
+
+logger = logging.getLogger(__name__)
+# Per-request chatter, sampled by the 'sampled' logging filter (see settings.LOGGING).
+poll_logger = logging.getLogger('spotify.poll')
+
+# At most one token refresh per session is in flight in this process; see
+# _shared_refresh_lock for other processes.
+_refresh_lock = StripedLocks()
+
+# session_id -> Spotify_token. Entries are served until the token is due for
+# refresh, then reloaded, so a token refreshed by another process is picked up
+# before the cached access token expires. Treat cached instances as read-only.
+_token_cache = {}
+
+
+def get_cached_user_tokens(session_id):
+    """Return the user's cached Spotify token if it is still fresh, without touching the database."""
+    tokens = _token_cache.get(session_id)
+    if tokens is not None and not token_needs_refresh(tokens):
+        return tokens
+    return None
 
-BASE_URL = "https://api.spotify.com/v1/me/"
 
 def get_user_tokens(session_id):
-    """Fetch the user's Spotify token from the database."""
-    user_tokens = Spotify_token.objects.filter(user=session_id)
+    """Fetch the user's Spotify token, from the in-process cache when it is still fresh."""
+    return get_cached_user_tokens(session_id) or _load_user_tokens(session_id)
 
-    if user_tokens.exists():
-        return user_tokens.first()
 
-    print(f"[DEBUG] No Spotify token found for session ID: {session_id}")
-    return None
+def _load_user_tokens(session_id):
+    """Fetch the user's Spotify token from the database and cache it."""
+    with span("token lookup"):
+        tokens = Spotify_token.objects.filter(user=session_id).first()
+
+    if tokens is None:
+        _token_cache.pop(session_id, None)
+        logger.debug("No Spotify token session=%s", session_id)
+        return None
+
+    _token_cache[session_id] = tokens
+    return tokens
+
+
+def invalidate_user_tokens(session_id):
+    """Drop a session's cached token so the next lookup reads the database."""
+    _token_cache.pop(session_id, None)
+
 
 def update_or_create_user_tokens(session_id, access_token, token_type, expires_in, refresh_token):
     """Update or create a Spotify token record in the database."""
 
     if expires_in is None:
-        print(f"[ERROR] expires_in is None for session ID: {session_id}")
-        return  #  Prevent storing an invalid token.
+        logger.error("Refusing to store token without expires_in session=%s", session_id)
+        return None  #  Prevent storing an invalid token.
 
     expires_at = timezone.now() + timedelta(seconds=expires_in)
-    print(f"[DEBUG] Storing Spotify token for session {session_id} - Expires at: {expires_at}")
-
-    tokens = get_user_tokens(session_id)
+    tokens, created = Spotify_token.objects.update_or_create(
+        user=session_id,
+        defaults={
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+            'expires_in': expires_at,  #  Store expiry correctly
+            'token_type': token_type,
+        }
+    )
+    _token_cache[session_id] = tokens  # Write through so readers skip the database
 
-    if tokens:
-        print(f"[DEBUG] Updating existing token for session {session_id}")
-        tokens.access_token = access_token
-        tokens.refresh_token = refresh_token
-        tokens.expires_in = expires_at  #  Store correct expiry
-        tokens.token_type = token_type
-        tokens.save(update_fields=['access_token', 'refresh_token', 'expires_in', 'token_type'])
-    else:
-        print(f"[DEBUG] Creating new token for session {session_id}")
-        tokens = Spotify_token(
-            user=session_id,
-            access_token=access_token,
-            refresh_token=refresh_token,
-            token_type=token_type,
-            expires_in=expires_at  #  Store expiry correctly
-        )
-        tokens.save()
-
-    print(f"[DEBUG] Token successfully stored for session {session_id} - Expiry: {tokens.expires_in}")
+    logger.info("Stored Spotify token session=%s created=%s expires_at=%s", session_id, created, expires_at)
+    return tokens
 
 
 def is_spotify_authenticated(session_id):
@@ -55,54 +89,104 @@ def is_spotify_authenticated(session_id):
     tokens = get_user_tokens(session_id)
 
     if not tokens:
-        print(f"[DEBUG] No Spotify token found for session ID: {session_id}")
         return False
 
-    expiry = tokens.expires_in
+    if tokens.expires_in is None or tokens.expires_in <= timezone.now():
+        logger.info("Token expired, refreshing inline session=%s", session_id)
+        tokens = refresh_spotify_token(session_id)
 
-    if expiry is None:
-        print(f"[ERROR] Expiry time is None for session ID: {session_id}. Forcing token refresh.")
-        refresh_spotify_token(session_id)
-        tokens = get_user_tokens(session_id)
+        if not tokens or tokens.expires_in is None or tokens.expires_in <= timezone.now():
+            logger.error("Inline token refresh failed session=%s", session_id)
+            return False
 
-        if not tokens or tokens.expires_in is None:
-            print(f"[ERROR] Failed to refresh token for session ID: {session_id}")
-            return False 
+    return True
 
-        expiry = tokens.expires_in  
 
-    if expiry <= timezone.now():
-        print(f"[DEBUG] Token expired for session ID: {session_id}, refreshing...")
-        refresh_spotify_token(session_id)
-        tokens = get_user_tokens(session_id)
+def token_needs_refresh(tokens):
+    """True when a token has no expiry or expires within SPOTIFY_TOKEN_REFRESH_MARGIN seconds."""
+    horizon = timezone.now() + timedelta(seconds=settings.SPOTIFY_TOKEN_REFRESH_MARGIN)
+    return tokens.expires_in is None or tokens.expires_in <= horizon
 
-        if not tokens or tokens.expires_in <= timezone.now():
-            print(f"[ERROR] Failed to refresh token for session ID: {session_id}")
-            return False  
 
-    print(f"[DEBUG] Spotify authentication check passed for session ID: {session_id}. Token expires at {expiry}")
-    return True
+def refresh_lock_key(session_id):
+    return f"spotify:token-refresh:{session_id}"
 
 
-def refresh_spotify_token(session_id):
-    """Refresh the Spotify access token using the refresh token."""
-    tokens = get_user_tokens(session_id)
-    if not tokens:
-        print(f"[ERROR] No token found for session {session_id}, cannot refresh.")
-        return
+@contextmanager
+def _shared_refresh_lock(session_id):
+    """
+    Hold a session's refresh lock in the cache, so that processes sharing it
+    (REDIS_URL) refresh one at a time; with the per-process default cache this
+    adds nothing to _refresh_lock.
 
+    A process that finds the lock taken polls until it is released, then
+    re-reads the token the holder stored. The lock expires after
+    SPOTIFY_TOKEN_REFRESH_LOCK_TIMEOUT so a crashed holder can't block the
+    session; a waiter that reaches that deadline goes ahead without it.
+    """
+    key, owner = refresh_lock_key(session_id), uuid.uuid4().hex
+    timeout = settings.SPOTIFY_TOKEN_REFRESH_LOCK_TIMEOUT
+    deadline = time.monotonic() + timeout
+    acquired = cache.add(key, owner, timeout=timeout)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.05)
+        acquired = cache.add(key, owner, timeout=timeout)
+    try:
+        yield
+    finally:
+        if acquired and cache.get(key) == owner:  # Not if it expired and another process took it
+            cache.delete(key)
+
+
+def refresh_spotify_token(session_id, rejected_access_token=None):
+    """
+    Refresh the Spotify access token using the refresh token.
+
+    Refreshes are single-flight per session, within this process and across
+    processes sharing the cache: a caller that arrives while one is running
+    waits for it, then finds the token fresh and returns without calling
+    Spotify again. After a 401, pass the rejected access token to force
+    a refresh unless that token has already been replaced.
+
+    Returns the session's current token afterwards, or None if it has none.
+    """
+    with span("token refresh"), _refresh_lock(session_id), _shared_refresh_lock(session_id):
+        # Read the database, not the cache: another process may have refreshed.
+        tokens = _load_user_tokens(session_id)
+        if not tokens:
+            logger.warning("Cannot refresh, no token session=%s", session_id)
+            return None
+
+        if rejected_access_token is not None:
+            if tokens.access_token != rejected_access_token:
+                spotify_token_refreshes.inc("already_refreshed")
+                return tokens
+        elif not token_needs_refresh(tokens):
+            spotify_token_refreshes.inc("already_refreshed")
+            return tokens
+
+        return _request_token_refresh(session_id, tokens) or tokens
+
+
+def _request_token_refresh(session_id, tokens):
+    invalidate_user_tokens(session_id)
     refresh_token = tokens.refresh_token
-    print(f"[DEBUG] Refreshing token for session {session_id}...")
+    logger.debug("Refreshing token session=%s", session_id)
 
-    response = post(
-        'https://accounts.spotify.com/api/token',
-        data={
-            'grant_type': 'refresh_token',
-            'refresh_token': refresh_token,
-            'client_id': CLIENT_ID,
-            'client_secret': CLIENT_SECRET
-        }
-    ).json()
+    try:
+        response = client.post(
+            settings.SPOTIFY_ACCOUNTS_URL + 'api/token',
+            data={
+                'grant_type': 'refresh_token',
+                'refresh_token': refresh_token,
+                'client_id': CLIENT_ID,
+                'client_secret': CLIENT_SECRET
+            }
+        ).json()
+    except requests.exceptions.RequestException as e:
+        logger.error("Token refresh request failed session=%s error=%s", session_id, e)
+        spotify_token_refreshes.inc("failed")
+        return None
 
     access_token = response.get('access_token')
     token_type = response.get('token_type')
@@ -110,58 +194,125 @@ def refresh_spotify_token(session_id):
     new_refresh_token = response.get('refresh_token', refresh_token)  # Keep old refresh token if not provided
 
     if expires_in is None:
-        print(f"[ERROR] Failed to retrieve expires_in value during token refresh for session {session_id}")
-        return
+        logger.error("Token refresh response had no expires_in session=%s", session_id)
+        spotify_token_refreshes.inc("failed")
+        return None
 
-    print(f"[DEBUG] Successfully refreshed token for session {session_id}. New expiry: {expires_in} seconds from now.")
+    spotify_token_refreshes.inc("refreshed")
+    return update_or_create_user_tokens(session_id, access_token, token_type, expires_in, new_refresh_token)
 
-    update_or_create_user_tokens(session_id, access_token, token_type, expires_in, new_refresh_token)
 
+# Retry decisions returned by retry_action().
+REFRESH_AND_RETRY = "refresh"  # 401: refresh the token, retry with the new one
+RETRY = "retry"  # Short 429: retry after retry_wait() seconds
 
-def execute_spotify_api_request(session_id, endpoint, post_=False, put_=False):
-    """Make API requests to Spotify with authentication."""
-    tokens = get_user_tokens(session_id)
-    if not tokens:
-        print("[ERROR] No valid Spotify token found.")
-        return {'Error': 'User not authenticated'}
 
-    headers = {
+def auth_headers(tokens):
+    return {
         'Content-Type': 'application/json',
         'Authorization': f"Bearer {tokens.access_token}"
     }
 
-    try:
-        if post_:
-            response = requests.post(BASE_URL + endpoint, headers=headers)
-        elif put_:
-            response = requests.put(BASE_URL + endpoint, headers=headers)
-        else:
-            response = requests.get(BASE_URL + endpoint, headers=headers)
 
-        print(f"[DEBUG] Spotify API request: {BASE_URL}{endpoint} - Status Code: {response.status_code}")
+def retry_action(response, session_id, endpoint):
+    """How to follow up a first response from Spotify: REFRESH_AND_RETRY, RETRY or None."""
+    if response.status_code == 401:
+        logger.info("Spotify returned 401, refreshing token and retrying session=%s endpoint=%s", session_id, endpoint)
+        return REFRESH_AND_RETRY
+    if response.status_code == 429 and retry_after_seconds(response) <= settings.SPOTIFY_RATE_LIMIT_WAIT:
+        logger.warning("Spotify returned 429, retrying endpoint=%s retry_after=%s", endpoint, retry_after_seconds(response))
+        spotify_retries.inc("429")
+        return RETRY
+    return None
 
-        if response.status_code == 204:
-            print(f"[DEBUG] No content from Spotify for endpoint: {endpoint}")
-            return {'Error': 'No content available (204 No Content)'}
 
-        if response.status_code == 401:
-            print(f"[ERROR] Unauthorized request (401). Token may be expired. Refreshing token...")
-            refresh_spotify_token(session_id)
-            return {'Error': 'Unauthorized (401). Token may have expired.'}
+def retry_wait(response):
+    """
+    Seconds to sleep before retrying a 429. A host with a rate limiter needs
+    none, because the client paused the limiter for the Retry-After and the
+    retry waits there. Without one (SPOTIFY_RATE_LIMIT None) nothing else
+    holds the retry back, so the caller sleeps it out.
+    """
+    if rate_limiter(urlsplit(str(response.url)).hostname) is not None:
+        return 0
+    return retry_after_seconds(response)
 
-        if response.status_code != 200:
-            print(f"[ERROR] Spotify API error {response.status_code}: {response.text}")
-            return {'Error': f"Spotify API error {response.status_code}: {response.text}"}
 
-        print(f"[DEBUG] Successful response from Spotify API: {response.json()}")
-        return response.json()
+def spotify_result(response, endpoint):
+    """
+    Turn Spotify's final response (requests or httpx) into the parsed body or
+    an {'Error': ...} dict; see execute_spotify_api_request.
+    """
+    poll_logger.debug("Spotify request endpoint=%s status=%s", endpoint, response.status_code)
+
+    if response.status_code == 204:
+        return {'Error': 'No content available (204 No Content)'}
+
+    if response.status_code == 401:
+        return {'Error': 'Unauthorized (401). Token may have expired.'}
+
+    if response.status_code == 429:
+        return {'Error': f"Rate limited by Spotify (429). Retry after {retry_after_seconds(response)} seconds.", 'Unavailable': True}
 
-    except requests.exceptions.JSONDecodeError:
-        print(f"[ERROR] Failed to parse JSON from Spotify API at endpoint: {endpoint}")
+    if response.status_code >= 500:
+        logger.error("Spotify server error endpoint=%s status=%s", endpoint, response.status_code)
+        return {'Error': f"Spotify API error {response.status_code}", 'Unavailable': True}
+
+    if response.status_code != 200:
+        logger.warning("Spotify API error endpoint=%s status=%s body=%.200s", endpoint, response.status_code, response.text)
+        return {'Error': f"Spotify API error {response.status_code}: {response.text}"}
+
+    try:
+        return response.json()
+    except ValueError:  # Both clients' JSON decode errors subclass it
+        logger.error("Invalid JSON from Spotify endpoint=%s", endpoint)
         return {'Error': 'Invalid JSON response from Spotify'}
 
+
+def execute_spotify_api_request(session_id, endpoint, post_=False, put_=False):
+    """
+    Make API requests to Spotify with authentication.
+
+    A 401 refreshes the token and retries once with the new one. A 429 pauses
+    every call to Spotify from this process for its Retry-After; when that is
+    no longer than SPOTIFY_RATE_LIMIT_WAIT the call waits it out and retries
+    once, otherwise the 429 is returned as an error straight away.
+
+    Errors caused by Spotify being unreachable, overloaded or rate limiting us
+    carry 'Unavailable': True, so callers can fall back to the last known state.
+    """
+    tokens = get_user_tokens(session_id)
+    if not tokens:
+        logger.warning("No Spotify token for API request session=%s endpoint=%s", session_id, endpoint)
+        return {'Error': 'User not authenticated'}
+
+    url = settings.SPOTIFY_API_URL + 'me/' + endpoint
+    method = 'POST' if post_ else 'PUT' if put_ else 'GET'
+
+    def send(tokens):
+        with span("spotify", method=method, endpoint=endpoint):
+            return client.request(method, url, headers=auth_headers(tokens))
+
+    try:
+        response = send(tokens)
+        action = retry_action(response, session_id, endpoint)
+        if action == REFRESH_AND_RETRY:
+            refreshed = refresh_spotify_token(session_id, tokens.access_token)
+            if refreshed and refreshed.access_token != tokens.access_token:
+                spotify_retries.inc("401")
+                response = send(refreshed)
+        elif action == RETRY:
+            time.sleep(retry_wait(response))
+            response = send(tokens)
+        return spotify_result(response, endpoint)
+
+    except requests.exceptions.RequestException as e:
+        # Timeouts, connection failures, an open circuit or an exhausted rate limit.
+        logger.warning("Spotify unavailable endpoint=%s error=%s", endpoint, e)
+        return {'Error': f"Spotify unavailable: {e}", 'Unavailable': True}
+
     except Exception as e:
-        print(f"[ERROR] Unexpected error calling Spotify API: {e}")
+        logger.exception("Unexpected error calling Spotify endpoint=%s", endpoint)
         return {'Error': f"Unexpected error: {str(e)}"}
 
 def is_premium_user(session_id):
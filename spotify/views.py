@@ -1,21 +1,36 @@
+import logging
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.response import Response
-from requests import Request, post
+from requests import Request
+from requests.exceptions import RequestException
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from .credentials import REDIRECT_URI, CLIENT_SECRET, CLIENT_ID
+from .album_art import IMMUTABLE, fetch_album_art, for_display, parse_art_size
+from .client import client
 from .util import *
+from .now_playing import get_many_room_states, get_room_state, invalidate_now_playing, state_etag
+from .push import broadcaster
+from .scheduler import scheduler
+from .skips import skip_queue
+from .votes import ALREADY_VOTED, SKIP, cast_skip_vote
+from api.conditional import add_validators, make_etag, not_modified
 from api.models import Room
-from .models import Vote
+from music_controller.tracing import span
+
+logger = logging.getLogger(__name__)
 
 class AuthURL(APIView):
     def get(self, request, format=None):
         scopes = 'user-read-playback-state user-modify-playback-state user-read-currently-playing'
 
-        url = Request('GET', 'https://accounts.spotify.com/authorize', params={
+        url = Request('GET', settings.SPOTIFY_ACCOUNTS_URL + 'authorize', params={
             'scope': scopes,
             'response_type': 'code',
             'redirect_uri': REDIRECT_URI,
@@ -30,16 +45,20 @@ def spotify_callback(request, format=None):
     error = request.GET.get('error')
 
     if error:
-        print(f"[ERROR] Spotify Authentication failed: {error}")
+        logger.warning("Spotify authorization failed error=%s", error)
         return redirect('frontend:')
 
-    response = post('https://accounts.spotify.com/api/token', data={
-        'grant_type': 'authorization_code',
-        'code': code,
-        'redirect_uri': REDIRECT_URI,
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET
-    }).json()
+    try:
+        response = client.post(settings.SPOTIFY_ACCOUNTS_URL + 'api/token', data={
+            'grant_type': 'authorization_code',
+            'code': code,
+            'redirect_uri': REDIRECT_URI,
+            'client_id': CLIENT_ID,
+            'client_secret': CLIENT_SECRET
+        }).json()
+    except RequestException as e:
+        logger.error("Spotify token request failed error=%s", e)
+        return redirect('frontend:')
 
     access_token = response.get('access_token')
     token_type = response.get('token_type')
@@ -47,7 +66,7 @@ def spotify_callback(request, format=None):
     expires_in = response.get('expires_in')
 
     if not access_token or not expires_in:
-        print("[ERROR] Failed to retrieve access token from Spotify API")
+        logger.error("Spotify token response had no access token")
         return redirect('frontend:')
 
     if not request.session.exists(request.session.session_key):
@@ -57,7 +76,7 @@ def spotify_callback(request, format=None):
     
     update_or_create_user_tokens(session_id, access_token, token_type, expires_in, refresh_token)
     
-    print(f"[DEBUG] Spotify Authentication Successful for session: {session_id}")
+    logger.info("Spotify authorization succeeded session=%s", session_id)
     return redirect('frontend:')
 
 
@@ -73,37 +92,87 @@ class CurrentSong(APIView):
         if not room_code:
             return Response({"error": "User is not in a room"}, status=status.HTTP_400_BAD_REQUEST)
 
-        room = get_object_or_404(Room, code=room_code)
-        host = room.host
-        
-        endpoint = "player/currently-playing"
-        response = execute_spotify_api_request(host, endpoint)
-
-        if "error" in response or response.get("item") is None:
+        with span("room lookup"):
+            room = get_object_or_404(Room, code=room_code)
+        with span("room state"):
+            song = get_room_state(room)
+        scheduler.touch(room.code)
+        if song is None:
             return Response({"error": "No song is currently playing"}, status=status.HTTP_204_NO_CONTENT)
 
-        song_id = response["item"]["id"]
-        self.update_room_song(room, song_id)
+        etag = state_etag(song)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        song = for_display(song, parse_art_size(request.GET.get("art_size")))
+        return add_validators(Response(song, status=status.HTTP_200_OK), etag)
 
-        votes = Vote.objects.filter(room=room, song_id=song_id).count()
 
-        song = {
-            "title": response["item"]["name"],
-            "artist": ", ".join(artist["name"] for artist in response["item"]["artists"]),
-            "album_image": response["item"]["album"]["images"][0]["url"],
-            "progress_ms": response["progress_ms"],
-            "duration_ms": response["item"]["duration_ms"],
-            "votes": votes,
-            "votes_required": room.votes_to_skip,
-            "song_id": song_id,
-        }
-        return Response(song, status=status.HTTP_200_OK)
+class NowPlayingBatch(APIView):
+    """
+    Now-playing and vote state for several rooms, for dashboards and wall displays.
 
-    def update_room_song(self, room, song_id):
-        if room.current_song != song_id:
-            room.current_song = song_id
-            room.save(update_fields=["current_song"])
-            Vote.objects.filter(room=room).delete()
+    GET /spotify/now-playing?rooms=CODE1,CODE2 returns {"rooms": {code: state}},
+    with state null where nothing plays; unknown codes are left out. It needs
+    no session, and answers from the playback cache, which stays warm for the
+    requested rooms while they are polled. art_size picks the album image as
+    for /spotify/current-song.
+    """
+    def get(self, request, format=None):
+        codes = list(dict.fromkeys(code for code in request.GET.get("rooms", "").split(",") if code))
+        if not codes:
+            return Response({"error": "No room codes given"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(codes) > settings.SPOTIFY_BATCH_MAX_ROOMS:
+            return Response(
+                {"error": f"At most {settings.SPOTIFY_BATCH_MAX_ROOMS} rooms per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        rooms = list(Room.objects.filter(code__in=codes))
+        states = get_many_room_states(rooms)
+        for room in rooms:
+            scheduler.touch(room.code)
+        size = parse_art_size(request.GET.get("art_size"))
+        states = {code: for_display(state, size) for code, state in states.items()}
+        return Response({"rooms": states}, status=status.HTTP_200_OK)
+
+
+async def now_playing_events(request):
+    """Server-sent event stream of the room's now-playing state."""
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would buffer the endless stream; clients fall back to polling.
+        return JsonResponse({"error": "Event stream requires the ASGI server"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    room_code = await sync_to_async(request.session.get)("room_code")
+    if not room_code:
+        return JsonResponse({"error": "User is not in a room"}, status=status.HTTP_400_BAD_REQUEST)
+
+    size = parse_art_size(request.GET.get("art_size"))
+    response = StreamingHttpResponse(
+        broadcaster.stream(room_code, lambda state: for_display(state, size)), content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Stop nginx from buffering the stream
+    return response
+
+
+def album_art(request, image_id):
+    """
+    Album image from the local disk cache (ALBUM_ART_PROXY), so every client in
+    a venue shares one download from Spotify's CDN.
+    """
+    if not settings.ALBUM_ART_PROXY:
+        raise Http404("Album art proxy is disabled")
+    etag = make_etag("album-art", image_id)
+    response = not_modified(request, etag)
+    if response is None:
+        image = fetch_album_art(image_id)
+        if image is None:
+            return JsonResponse({"error": "Album art unavailable"}, status=status.HTTP_502_BAD_GATEWAY)
+        path, content_type = image
+        response = add_validators(FileResponse(open(path, "rb"), content_type=content_type), etag)
+    response["Cache-Control"] = IMMUTABLE
+    return response
 
 
 class PauseSong(APIView):
@@ -122,6 +191,8 @@ class PauseSong(APIView):
         
         if session_key == room.host or room.guest_can_pause:
             pause_song(room.host)
+            invalidate_now_playing(room.code)
+            scheduler.poke(room.code)
             return Response({}, status=status.HTTP_204_NO_CONTENT)
 
         return Response({"error": "Not authorized to pause song"}, status=status.HTTP_403_FORBIDDEN)
@@ -131,6 +202,8 @@ class PlaySong(APIView):
         room = get_object_or_404(Room, code=self.request.session.get('room_code'))
         if self.request.session.session_key == room.host or room.guest_can_pause:
             play_song(room.host)
+            invalidate_now_playing(room.code)
+            scheduler.poke(room.code)
             return Response({}, status=status.HTTP_204_NO_CONTENT)
         return Response({"error": "Not a premium User"}, status=status.HTTP_403_FORBIDDEN)
 
@@ -146,21 +219,13 @@ class SkipSong(APIView):
         if not song_id:
             return Response({"error": "No song is currently playing"}, status=status.HTTP_400_BAD_REQUEST)
 
-        votes = Vote.objects.filter(room=room, song_id=song_id)
-        votes_needed = room.votes_to_skip
-
-        print(f"[DEBUG] Current votes for {song_id}: {votes.count()}/{votes_needed}")
-
-        if Vote.objects.filter(room=room, song_id=song_id, user=request.session.session_key).exists():
+        outcome = cast_skip_vote(room, request.session.session_key)
+        if outcome == ALREADY_VOTED:
             return Response({"error": "You have already voted"}, status=status.HTTP_403_FORBIDDEN)
 
-        Vote.objects.create(user=request.session.session_key, room=room, song_id=song_id)
-
-        if votes.count() + 1 >= votes_needed:
-            print(f"[DEBUG] Vote threshold reached! Skipping song: {song_id}")
-            execute_spotify_api_request(room.host, "player/next", post_=True)
-            room.current_song = None
-            room.save(update_fields=["current_song"])
-            Vote.objects.filter(room=room).delete()
+        if outcome == SKIP:
+            skip_queue.submit(room, song_id)
+        else:
+            scheduler.notify(room)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,68 @@
+import logging
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from api.models import Room
+from .models import Vote
+from .now_playing import invalidate_now_playing
+
+logger = logging.getLogger(__name__)
+
+ALREADY_VOTED = "already_voted"
+VOTED = "voted"
+SKIP = "skip"
+
+
+def cast_skip_vote(room, user):
+    """
+    Record a user's vote to skip the room's current song.
+
+    Returns ALREADY_VOTED if the user had voted for this song, SKIP if this
+    vote reached the room's threshold, and VOTED otherwise.
+
+    A vote is three statements in one transaction: the insert (rejected by the
+    unique constraint on a repeat vote), an F() increment of Room.skip_votes,
+    and a conditional update that claims the skip by clearing current_song.
+    Only one voter's claim can match, so concurrent votes crossing the
+    threshold together still skip the song exactly once.
+
+    The claim also records the song in Room.skipped_song and drops the cached
+    now-playing payload. Until Spotify reports another track, polls that still
+    see the skipped song (from the cache or a fetch sent before player/next)
+    leave the room alone instead of restoring it as the current song.
+    """
+    song_id = room.current_song
+    rooms = Room.objects.filter(pk=room.pk, current_song=song_id)
+
+    try:
+        with transaction.atomic():
+            Vote.objects.create(user=user, room=room, song_id=song_id)
+            rooms.update(skip_votes=F("skip_votes") + 1)
+            claimed = rooms.filter(skip_votes__gte=F("votes_to_skip")).update(
+                current_song=None, skip_votes=0, skipped_song=song_id, updated_at=timezone.now(),
+            )
+    except IntegrityError:
+        return ALREADY_VOTED
+
+    if claimed:
+        logger.info("Skip vote threshold reached room=%s song=%s", room.code, song_id)
+        room.current_song, room.skip_votes, room.skipped_song = None, 0, song_id
+        invalidate_now_playing(room.code)
+        return SKIP
+    room.skip_votes += 1
+    return VOTED
+
+
+def reset_skip_votes(room, song_id):
+    """
+    Delete the votes for a room's skipped song once Spotify has moved on.
+
+    Only that song's votes go: guests may already be voting on the next one,
+    and those votes are counted in Room.skip_votes.
+    """
+    Vote.objects.filter(room=room, song_id=song_id).delete()
+
+
+def release_skip(room, song_id):
+    """Let polls record a skipped song again after player/next failed and it kept playing."""
+    Room.objects.filter(pk=room.pk, skipped_song=song_id).update(skipped_song=None)